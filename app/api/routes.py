@@ -1,9 +1,34 @@
+import hmac
+import asyncio
 import logging
-from fastapi import APIRouter, FastAPI, HTTPException, Depends
+from fastapi import APIRouter, FastAPI, HTTPException, Depends, Request, Header, Response
+from telebot import types
 from pydantic import BaseModel
-from typing import Optional
+from typing import Any, Dict, List, Optional
 import os
-from app.bot.notifications import send_notification
+from app.bot.notifications import (
+    enqueue_notification,
+    get_notification_status,
+    start_bulk_notification,
+    get_notification_job
+)
+from app.bot.outbox import get_outbox
+from app.bot.dispatcher import notification_dispatcher
+from app.bot.bot import update_executor, llm_queue, conversation_store, get_update_mode
+from app.bot.history import history_stats
+from app.utils.log import log_stats
+from app.services.directus import invalidate_reference_cache, invalidate_bus_schedule, REFERENCE_COLLECTIONS
+from app.services.webapp import (
+    invalidate_user_link, invalidate_status_snapshots, recompute_status_snapshots, SNAPSHOT_SOURCES
+)
+from app.services.status_snapshots import status_snapshots
+from app.services.llm_rag import answer_cache
+from app.utils.cache import get_cache_stats
+from app.utils.singleflight import get_singleflight_stats
+from app.utils.batch import get_batch_loader_stats
+from app.utils.circuit import get_circuit_stats, STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN
+from app.utils.metrics import registry
+from app.utils.tracing import start_span, parse_traceparent, get_tracing_stats, SPAN_KIND_SERVER
 
 logger = logging.getLogger(__name__)
 
@@ -15,34 +40,287 @@ class NotificationRequest(BaseModel):
     status: Optional[str] = None
 
 
+class BulkNotificationRequest(BaseModel):
+    user_ids: Optional[List[int]] = None
+    # Directus filter on telegram_user_links, used when user_ids is not given
+    filter: Optional[Dict[str, Any]] = None
+    notification_type: str
+    message: str
+    status: Optional[str] = None
+
+
+class CacheInvalidationRequest(BaseModel):
+    collection: Optional[str] = None
+    item_id: Optional[str] = None
+
+
+class UserLinkInvalidationRequest(BaseModel):
+    telegram_id: int
+
+
+class AnswerCachePurgeRequest(BaseModel):
+    directory: Optional[str] = None
+
+
+class DirectusChangeEvent(BaseModel):
+    # Body of a Directus webhook or a flow's "Event Hook" trigger, e.g. event "items.update"
+    event: str = ""
+    collection: str
+    key: Optional[Any] = None
+    keys: Optional[List[Any]] = None
+    payload: Optional[Any] = None
+
+
 router = APIRouter(prefix="/api", tags=["notifications"])
+telegram_router = APIRouter(prefix="/telegram", tags=["telegram"])
+metrics_router = APIRouter(tags=["metrics"])
 
 bot = None
 
+# Strong references to in-flight update and snapshot refresh tasks, so they are not garbage collected mid-run
+update_tasks = set()
+
 
 @router.post("/notify")
-async def send_user_notification(notification: NotificationRequest):
+async def send_user_notification(notification: NotificationRequest, traceparent: Optional[str] = Header(None)):
     logger.info(f"Received notification request for user {notification.user_id}")
 
     try:
+        # The caller's W3C traceparent, if any, makes this request part of its trace
+        with start_span(
+            "POST /api/notify", kind=SPAN_KIND_SERVER, parent=parse_traceparent(traceparent),
+            **{"notification.type": notification.notification_type, "telegram.user_id": notification.user_id}
+        ):
+            notification_id = await enqueue_notification(
+                notification.user_id,
+                notification.notification_type,
+                notification.message,
+                notification.status
+            )
 
-        result = send_notification(
-            bot,
-            notification.user_id,
+        return {"status": "success", "message": "Notification queued", "notification_id": notification_id}
+
+    except Exception as e:
+        logger.error(f"Failed to queue notification: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to queue notification: {str(e)}")
+
+
+@router.post("/notify/bulk")
+async def send_bulk_notification(notification: BulkNotificationRequest, traceparent: Optional[str] = Header(None)):
+    if notification.user_ids is None and notification.filter is None:
+        raise HTTPException(status_code=400, detail="Either user_ids or filter must be provided")
+
+    with start_span(
+        "POST /api/notify/bulk", kind=SPAN_KIND_SERVER, parent=parse_traceparent(traceparent),
+        **{"notification.type": notification.notification_type}
+    ):
+        job_id = await start_bulk_notification(
             notification.notification_type,
             notification.message,
-            notification.status
+            notification.status,
+            user_ids=notification.user_ids,
+            directus_filter=notification.filter
         )
+    return {"status": "success", "job_id": job_id}
 
-        return {"status": "success", "message": "Notification sent successfully"}
 
-    except Exception as e:
-        logger.error(f"Failed to send notification: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to send notification: {str(e)}")
+@router.get("/notify/jobs/{job_id}")
+async def get_bulk_notification_job(job_id: str):
+    job = await get_notification_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Notification job not found")
+    return {"status": "success", "job": job}
+
+
+@router.get("/notify/{notification_id}")
+async def get_user_notification(notification_id: str):
+    notification = await get_notification_status(notification_id)
+    if notification is None:
+        raise HTTPException(status_code=404, detail="Notification not found")
+    return {"status": "success", "notification": notification}
+
+
+@router.post("/cache/invalidate")
+async def invalidate_cache(request: CacheInvalidationRequest):
+    if request.collection and request.collection not in REFERENCE_COLLECTIONS:
+        raise HTTPException(status_code=400, detail=f"Collection {request.collection} is not cached")
+
+    await invalidate_reference_cache(request.collection, request.item_id)
+    # Rendered statuses embed dormitory names and addresses, so they are rebuilt on the next read
+    status_snapshots.clear()
+    return {"status": "success", "message": "Cache invalidated"}
+
+
+@router.post("/user-links/invalidate")
+async def invalidate_user_link_cache(request: UserLinkInvalidationRequest):
+    invalidate_user_link(request.telegram_id)
+    return {"status": "success", "message": "User link cache invalidated"}
+
+
+@router.post("/bus-schedule/invalidate")
+async def invalidate_bus_schedule_cache():
+    invalidate_bus_schedule()
+    return {"status": "success", "message": "Bus schedule cache invalidated"}
+
+
+@router.post("/directus/webhook")
+async def directus_webhook(event: DirectusChangeEvent, x_directus_webhook_secret: Optional[str] = Header(None)):
+    secret = os.getenv("DIRECTUS_WEBHOOK_SECRET")
+    if secret and not hmac.compare_digest(x_directus_webhook_secret or "", secret):
+        logger.warning("Rejected Directus webhook request with invalid secret")
+        raise HTTPException(status_code=403, detail="Invalid secret")
+
+    if event.collection not in SNAPSHOT_SOURCES:
+        return {"status": "ignored", "message": f"Collection {event.collection} does not affect statuses"}
+
+    deleted = event.event.endswith("delete")
+    keys = event.keys or ([event.key] if event.key is not None else [])
+    if deleted and not keys and isinstance(event.payload, list):
+        # Delete events carry the removed keys as the payload
+        keys = event.payload
+
+    affected = await invalidate_status_snapshots(event.collection, keys, event.payload, deleted)
+
+    # Stale snapshots are gone once this returns; rendering the new ones happens after the response
+    task = asyncio.create_task(recompute_status_snapshots(affected))
+    update_tasks.add(task)
+    task.add_done_callback(update_tasks.discard)
+
+    return {"status": "success", "affected": len(affected)}
+
+
+@router.get("/bot/stats")
+async def bot_stats():
+    return {
+        "status": "success",
+        "executor": update_executor.stats(),
+        "llm_queue": llm_queue.stats(),
+        # A COUNT query with the SQLite store, so it runs off the event loop like the outbox stats
+        "active_conversations": await asyncio.to_thread(conversation_store.size),
+        "status_snapshots": status_snapshots.stats(),
+        "circuits": get_circuit_stats(),
+        "history": history_stats,
+        "logging": log_stats,
+        "tracing": get_tracing_stats(),
+        "dispatcher": notification_dispatcher.stats(),
+        "outbox": await asyncio.to_thread(get_outbox().stats)
+    }
+
+
+@router.post("/llm-cache/purge")
+async def purge_answer_cache(request: AnswerCachePurgeRequest):
+    purged = answer_cache.purge(request.directory)
+    return {"status": "success", "message": f"Purged {purged} cached answers"}
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    return {
+        "status": "success",
+        "caches": get_cache_stats(),
+        "llm_answers": answer_cache.stats(),
+        "singleflight": get_singleflight_stats(),
+        "batch_loaders": get_batch_loader_stats()
+    }
+
+
+@telegram_router.post("/webhook")
+async def telegram_webhook(request: Request, x_telegram_bot_api_secret_token: Optional[str] = Header(None)):
+    # Without the secret anyone could post updates on behalf of another user, so it is never optional
+    secret = os.getenv("TELEGRAM_WEBHOOK_SECRET")
+    if not secret or not hmac.compare_digest(x_telegram_bot_api_secret_token or "", secret):
+        logger.warning("Rejected Telegram webhook request with invalid secret token")
+        raise HTTPException(status_code=403, detail="Invalid secret token")
+
+    update = types.Update.de_json(await request.json())
+
+    # Acknowledge immediately; Telegram retries updates whose webhook call is slow to answer
+    task = asyncio.create_task(bot.process_new_updates([update]))
+    update_tasks.add(task)
+    task.add_done_callback(update_tasks.discard)
+
+    return {"ok": True}
+
+
+# Queue depths and cache counters are read from the components when /metrics is scraped
+registry.gauge_callback(
+    "bot_queue_depth", "Items waiting or running in the bot's queues.", ("queue", "state"),
+    lambda: [
+        (("executor", "pending"), update_executor.pending),
+        (("executor", "in_flight"), update_executor.in_flight),
+        (("llm", "waiting"), llm_queue.waiting),
+        (("llm", "active"), llm_queue.active)
+    ]
+)
+registry.gauge_callback(
+    "bot_active_conversations", "Users in an active Нейровопрос conversation.", (),
+    lambda: [((), conversation_store.size())]
+)
+registry.gauge_callback(
+    "notification_outbox_rows", "Notifications in the outbox by state.", ("state",),
+    lambda: [((state,), count) for state, count in get_outbox().stats().items()]
+)
+registry.gauge_callback(
+    "telegram_throttled_total", "Telegram 429 responses seen by the notification dispatcher.", (),
+    lambda: [((), notification_dispatcher.throttled)], kind="counter"
+)
+registry.gauge_callback(
+    "cache_requests_total", "Cache lookups by result.", ("cache", "result"),
+    lambda: [
+        ((stats["name"], result), stats[key])
+        for stats in get_cache_stats() for result, key in (("hit", "hits"), ("miss", "misses"))
+    ],
+    kind="counter"
+)
+registry.gauge_callback(
+    "cache_hit_ratio", "Share of cache lookups served from the cache.", ("cache",),
+    lambda: [((stats["name"],), stats["hit_ratio"]) for stats in get_cache_stats()]
+    + [(("llm_answers_with_similar",), answer_cache.stats()["hit_rate"])]
+)
+registry.gauge_callback(
+    "cache_entries", "Entries currently held by a cache.", ("cache",),
+    lambda: [((stats["name"],), stats["size"]) for stats in get_cache_stats()]
+)
+registry.gauge_callback(
+    "singleflight_coalesced_total", "Calls that waited for an identical in-flight call.", ("group",),
+    lambda: [((stats["name"],), stats["coalesced"]) for stats in get_singleflight_stats()],
+    kind="counter"
+)
+registry.gauge_callback(
+    "circuit_breaker_state", "Circuit breaker state: 0 closed, 1 half-open, 2 open.", ("circuit",),
+    lambda: [
+        ((stats["name"],), {STATE_CLOSED: 0, STATE_HALF_OPEN: 1, STATE_OPEN: 2}[stats["state"]])
+        for stats in get_circuit_stats()
+    ]
+)
+registry.gauge_callback(
+    "circuit_breaker_rejected_total", "Calls failed fast because their circuit was open.", ("circuit",),
+    lambda: [((stats["name"],), stats["rejected"]) for stats in get_circuit_stats()],
+    kind="counter"
+)
+registry.gauge_callback(
+    "batch_loader_requests_total", "Lookups by id and the batch requests that served them.", ("loader", "kind"),
+    lambda: [
+        ((stats["name"], kind), stats[kind])
+        for stats in get_batch_loader_stats() for kind in ("loads", "batches", "deduplicated", "memo_hits")
+    ],
+    kind="counter"
+)
+
+
+@metrics_router.get("/metrics")
+def metrics():
+    # A sync route runs in the threadpool, so the outbox and conversation store queries of the
+    # gauge callbacks do not block the event loop
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 def setup_routes(app: FastAPI, telegram_bot):
     global bot
     bot = telegram_bot
     app.include_router(router)
+    # In polling mode nothing legitimate posts updates, so the endpoint does not exist
+    if get_update_mode() == "webhook":
+        app.include_router(telegram_router)
+    app.include_router(metrics_router)
     logger.info("API routes registered")
\ No newline at end of file
@@ -1,16 +1,84 @@
 import os
+import time
+import asyncio
 import logging
-import telebot
-from telebot import types
-from app.services.directus import get_bus_schedule
+from telebot.async_telebot import AsyncTeleBot
+from telebot import types, asyncio_helper
+from app.services.directus import get_bus_schedule, STALE_DATA_NOTICE
 from app.services.webapp import check_checkin_status, check_relocation_status
-from app.services.llm_rag import ask_llm_rag
-
+from app.services.llm_rag import (
+    ask_llm_rag, stream_llm_rag, extract_answer, is_streaming_enabled, LLMStreamError
+)
+from app.bot.executor import ChatExecutor
+from app.bot.llm_queue import LLMJobQueue
+from app.bot.state import create_state_store
+from app.bot.history import append_turn, build_context
+from app.utils.log import redact_text
+from app.utils.metrics import telegram_latency
+from app.utils.tracing import start_span, SPAN_KIND_CLIENT
 
 logger = logging.getLogger(__name__)
 
-
-user_conversation_state = {}
+# Users in an active Нейровопрос conversation; the backend is chosen by CONVERSATION_STORE
+conversation_store = create_state_store()
+
+# Handlers run on a bounded worker pool, serialized per chat
+update_executor = ChatExecutor(
+    workers=int(os.getenv("BOT_WORKERS", "16")),
+    max_pending=int(os.getenv("BOT_MAX_PENDING_UPDATES", "1000")),
+    max_pending_per_chat=int(os.getenv("BOT_MAX_PENDING_PER_CHAT", "5"))
+)
+
+# Questions to the RAG backend are answered in the background with bounded concurrency
+llm_queue = LLMJobQueue(
+    concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+    max_queued=int(os.getenv("LLM_MAX_QUEUED", "200"))
+)
+
+TYPING_REFRESH_INTERVAL = 4
+# Backoff between attempts to drop a webhook before polling, capped at the last value
+REMOVE_WEBHOOK_RETRY_DELAYS = (1, 2, 5, 10, 30, 60)
+STREAM_EDIT_INTERVAL = float(os.getenv("LLM_STREAM_EDIT_INTERVAL", "1.5"))
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Telegram file_id of the uploaded schedule image, keyed by (schedule id, image url)
+bus_schedule_file_ids = {}
+
+class InstrumentedTeleBot(AsyncTeleBot):
+    """AsyncTeleBot that copies update_id onto messages and callbacks so handlers can log it."""
+
+    async def process_new_updates(self, updates):
+        for update in updates:
+            for payload in (update.message, update.edited_message, update.callback_query):
+                if payload is not None:
+                    payload.update_id = update.update_id
+        await super().process_new_updates(updates)
+
+def instrument_telegram_api():
+    """Time every Bot API call; all asyncio_helper methods go through _process_request."""
+    process_request = asyncio_helper._process_request
+    if getattr(process_request, "instrumented", False):
+        return
+
+    async def timed_process_request(token, url, *args, **kwargs):
+        status = "error"
+        started = time.perf_counter()
+        try:
+            with start_span(f"telegram {url}", kind=SPAN_KIND_CLIENT, **{"telegram.method": url}) as span:
+                try:
+                    result = await process_request(token, url, *args, **kwargs)
+                except asyncio_helper.ApiTelegramException as e:
+                    status = str(e.error_code)
+                    if span is not None:
+                        span.set_attribute("telegram.error_code", e.error_code)
+                    raise
+            status = "ok"
+            return result
+        finally:
+            telegram_latency.observe(time.perf_counter() - started, method=url, status=status)
+
+    timed_process_request.instrumented = True
+    asyncio_helper._process_request = timed_process_request
 
 def setup_bot():
     token = os.getenv("TELEGRAM_BOT_TOKEN")
@@ -18,35 +86,75 @@ def setup_bot():
         logger.error("Telegram bot token not found in environment variables")
         raise ValueError("TELEGRAM_BOT_TOKEN environment variable is not set")
 
-    bot = telebot.TeleBot(token)
+    # A local Bot API server (or the benchmark's stand-in) can replace api.telegram.org
+    api_url = os.getenv("TELEGRAM_API_URL")
+    if api_url:
+        asyncio_helper.API_URL = f"{api_url.rstrip('/')}/bot{{0}}/{{1}}"
+
+    instrument_telegram_api()
+    bot = InstrumentedTeleBot(token)
     logger.info("Telegram bot initialized")
 
     register_handlers(bot)
 
     return bot
 
-def register_handlers(bot):
-    global user_conversation_state
+def get_update_mode():
+    mode = os.getenv("TELEGRAM_UPDATE_MODE", "polling").lower()
+    if mode not in ("polling", "webhook"):
+        raise ValueError(f"Unsupported TELEGRAM_UPDATE_MODE: {mode}")
+    return mode
+
+async def setup_webhook(bot):
+    webhook_url = os.getenv("TELEGRAM_WEBHOOK_URL")
+    if not webhook_url:
+        logger.error("Telegram webhook URL not found in environment variables")
+        raise ValueError("TELEGRAM_WEBHOOK_URL environment variable is not set")
+
+    secret = os.getenv("TELEGRAM_WEBHOOK_SECRET")
+    if not secret:
+        logger.error("Telegram webhook secret not found in environment variables")
+        raise ValueError("TELEGRAM_WEBHOOK_SECRET environment variable is not set")
+
+    await bot.set_webhook(url=webhook_url, secret_token=secret)
+    logger.info(f"Telegram webhook set to {webhook_url}")
+
+async def run_polling(bot):
+    # getUpdates is refused while a webhook is set; Telegram being briefly unreachable must not stop startup
+    attempt = 0
+    while True:
+        try:
+            await bot.remove_webhook()
+            break
+        except Exception as e:
+            delay = REMOVE_WEBHOOK_RETRY_DELAYS[min(attempt, len(REMOVE_WEBHOOK_RETRY_DELAYS) - 1)]
+            attempt += 1
+            logger.warning(f"Failed to remove webhook before polling, retrying in {delay}s: {e}")
+            await asyncio.sleep(delay)
 
+    # The bot shares uvicorn's event loop, so handlers never block each other on I/O
+    await bot.infinity_polling()
 
-    logger.info(f"Initial user_conversation_state: {user_conversation_state}")
+async def is_in_conversation(message):
+    return await conversation_store.get(message.from_user.id) is not None
 
-    @bot.message_handler(commands=['start'])
-    def start_command(message):
+def register_handlers(bot):
 
-        if message.from_user.id in user_conversation_state:
-            del user_conversation_state[message.from_user.id]
+    @bot.message_handler(commands=['start'])
+    @update_executor.serial
+    async def start_command(message):
+        await conversation_store.delete(message.from_user.id)
 
         markup = create_main_keyboard()
-        bot.send_message(
+        await bot.send_message(
             message.chat.id,
             "Привет! Я бот для помощи с общежитием. Выберите опцию:",
             reply_markup=markup
         )
-        logger.info(f"Start command received from user {message.from_user.id}")
 
     @bot.message_handler(commands=['help'])
-    def help_command(message):
+    @update_executor.serial
+    async def help_command(message):
         help_text = (
             "Доступные команды:\n"
             "/start - Начать взаимодействие с ботом\n"
@@ -56,106 +164,82 @@ def register_handlers(bot):
             "Переселение - Проверить статус переселения\n"
             "Расписание автобусов - Получить актуальное расписание автобусов"
         )
-        bot.send_message(message.chat.id, help_text)
-        logger.info(f"Help command received from user {message.from_user.id}")
+        await bot.send_message(message.chat.id, help_text)
 
     @bot.message_handler(func=lambda message: message.text == "Заселение")
-    def checkin_handler(message):
-        logger.info(f"Check-in request from user {message.from_user.id}")
+    @update_executor.serial
+    async def checkin_handler(message):
         try:
-            status = check_checkin_status(message.from_user.id)
-            bot.send_message(message.chat.id, status,parse_mode="HTML")
+            status = await check_checkin_status(message.from_user.id)
+            await bot.send_message(message.chat.id, status,parse_mode="HTML")
         except Exception as e:
             logger.error(f"Error processing check-in request: {e}")
-            bot.send_message(
+            await bot.send_message(
                 message.chat.id,
                 "Произошла ошибка при получении информации о заселении. Пожалуйста, попробуйте позже."
             )
 
     @bot.message_handler(func=lambda message: message.text == "Переселение")
-    def relocation_handler(message):
-        logger.info(f"Relocation request from user {message.from_user.id}")
+    @update_executor.serial
+    async def relocation_handler(message):
         try:
-            status = check_relocation_status(message.from_user.id)
-            bot.send_message(message.chat.id, status, parse_mode="HTML")
+            status = await check_relocation_status(message.from_user.id)
+            await bot.send_message(message.chat.id, status, parse_mode="HTML")
         except Exception as e:
             logger.error(f"Error processing relocation request: {e}")
-            bot.send_message(
+            await bot.send_message(
                 message.chat.id,
                 "Произошла ошибка при получении информации о переселении. Пожалуйста, попробуйте позже."
             )
 
     @bot.message_handler(func=lambda message: message.text == "Расписание автобусов")
-    def bus_schedule_handler(message):
-        logger.info(f"Bus schedule request from user {message.from_user.id}")
+    @update_executor.serial
+    async def bus_schedule_handler(message):
         try:
-            schedule = get_bus_schedule()
-            print(schedule['image_url'])
+            schedule = await get_bus_schedule()
             if schedule and 'image_url' in schedule:
-                bot.send_photo(
-                    message.chat.id,
-                    schedule['image_url'] + "?download",
-                    caption="Актуальное расписание автобусов"
-                )
+                await send_bus_schedule_photo(bot, message.chat.id, schedule)
             else:
-                bot.send_message(
+                await bot.send_message(
                     message.chat.id,
                     "Расписание автобусов временно недоступно."
                 )
         except Exception as e:
             logger.error(f"Error processing bus schedule request: {e}")
-            bot.send_message(
+            await bot.send_message(
                 message.chat.id,
                 "Произошла ошибка при получении расписания автобусов. Пожалуйста, попробуйте позже."
             )
 
     @bot.message_handler(func=lambda message: message.text == "Нейровопрос")
-    def neural_question_handler(message):
+    @update_executor.serial
+    async def neural_question_handler(message):
         try:
             user_id = message.from_user.id
             chat_id = message.chat.id
 
-            logger.info(f"Neural question request from user {user_id}")
-
-            logger.info(f"Before creating markup for user {user_id}")
-
             markup = types.InlineKeyboardMarkup()
             start_btn = types.InlineKeyboardButton("Начать", callback_data="start_conversation")
             markup.add(start_btn)
-            logger.info(f"After creating markup for user {user_id}, button data: {start_btn.callback_data}")
-
 
             markup_json = {
                 'inline_keyboard': [
                     [{'text': 'Начать', 'callback_data': 'start_conversation'}]
                 ]
             }
-            logger.info(f"Created JSON markup for user {user_id}: {markup_json}")
-
-            logger.info(f"Before sending messages to user {user_id}")
 
-
-            sent_message1 = bot.send_message(
+            await bot.send_message(
                 chat_id,
                 "Здесь вы можете задать вопросы по заселению в общежитие. "
                 "Нейросеть постарается ответить на ваши вопросы максимально точно. "
                 "Нажмите 'Начать', чтобы начать разговор.",
                 reply_markup=markup
             )
-            logger.info(f"Sent message with standard markup to user {user_id}, message_id: {sent_message1.message_id}")
-
-
-
-            logger.info(f"After sending messages to user {user_id}")
         except Exception as e:
-            import traceback
-            error_traceback = traceback.format_exc()
-            logger.error(f"Error in neural_question_handler: {e}")
-            logger.error(f"Traceback: {error_traceback}")
-
+            logger.exception(f"Error in neural_question_handler: {e}")
 
             try:
-                bot.send_message(
+                await bot.send_message(
                     message.chat.id,
                     "Произошла ошибка при подготовке нейровопроса. Пожалуйста, попробуйте позже."
                 )
@@ -163,34 +247,20 @@ def register_handlers(bot):
                 logger.error(f"Failed to notify user about error: {notify_error}")
 
     @bot.callback_query_handler(func=lambda call: call.data == "start_conversation")
-    def start_conversation_callback(call):
+    @update_executor.serial
+    async def start_conversation_callback(call):
         try:
-            logger.info(f"Callback received: {call.data} from user {call.from_user.id}")
             user_id = call.from_user.id
             chat_id = call.message.chat.id
             message_text = call.message.text if hasattr(call.message, 'text') else ""
 
-            logger.info(f"Message text: {message_text}")
+            await bot.answer_callback_query(call.id)
 
-            logger.info(f"Before acknowledging callback query for user {user_id}")
-
-            bot.answer_callback_query(call.id)
-            logger.info(f"After acknowledging callback query for user {user_id}")
-
-            logger.info(f"Starting conversation with user {user_id}")
-
-            logger.info(f"Before updating user_conversation_state for user {user_id}")
-
-            user_conversation_state[user_id] = True
-            logger.info(f"After updating user_conversation_state for user {user_id}, current state: {user_conversation_state}")
-
-            logger.info(f"Before creating markup for user {user_id}")
+            await conversation_store.set(user_id, {"started_at": time.time()})
 
             markup = types.InlineKeyboardMarkup()
             end_btn = types.InlineKeyboardButton("Завершить разговор", callback_data="end_conversation")
             markup.add(end_btn)
-            logger.info(f"After creating markup for user {user_id}")
-
 
             markup_json = {
                 'inline_keyboard': [
@@ -198,66 +268,50 @@ def register_handlers(bot):
                 ]
             }
 
-            logger.info(f"Before updating message for user {user_id}")
-
-
             is_alternative = "Альтернативный вариант" in message_text
 
-
             try:
                 if is_alternative:
-                    logger.info(f"Editing alternative message for user {user_id}")
-
                     import json
-                    bot.edit_message_text(
+                    await bot.edit_message_text(
                         chat_id=chat_id,
                         message_id=call.message.message_id,
                         text="Разговор начат (альтернативный вариант). Задайте ваш вопрос по заселению в общежитие.",
                         reply_markup=json.dumps(markup_json)
                     )
                 else:
-
-                    bot.edit_message_text(
+                    await bot.edit_message_text(
                         chat_id=chat_id,
                         message_id=call.message.message_id,
                         text="Разговор начат. Задайте ваш вопрос по заселению в общежитие.",
                         reply_markup=markup
                     )
-                logger.info(f"Successfully edited message for user {user_id}")
             except Exception as edit_error:
                 logger.error(f"Error editing message: {edit_error}")
 
                 try:
-                    sent_message = bot.send_message(
+                    await bot.send_message(
                         chat_id,
                         "Разговор начат. Задайте ваш вопрос по заселению в общежитие.",
                         reply_markup=markup
                     )
-                    logger.info(f"Sent new message for user {user_id}, message_id: {sent_message.message_id}")
                 except Exception as send_error:
                     logger.error(f"Error sending new message: {send_error}")
 
                     try:
                         import json
-                        sent_message = bot.send_message(
+                        await bot.send_message(
                             chat_id,
                             "Разговор начат (альтернативный вариант). Задайте ваш вопрос по заселению в общежитие.",
                             reply_markup=json.dumps(markup_json)
                         )
-                        logger.info(f"Sent new message with JSON markup for user {user_id}, message_id: {sent_message.message_id}")
                     except Exception as json_error:
                         logger.error(f"Error sending message with JSON markup: {json_error}")
-
-            logger.info(f"After updating message for user {user_id}")
         except Exception as e:
-            import traceback
-            error_traceback = traceback.format_exc()
-            logger.error(f"Error in start_conversation_callback: {e}")
-            logger.error(f"Traceback: {error_traceback}")
-
+            logger.exception(f"Error in start_conversation_callback: {e}")
 
             try:
-                bot.send_message(
+                await bot.send_message(
                     call.message.chat.id,
                     "Произошла ошибка при начале разговора. Пожалуйста, попробуйте позже."
                 )
@@ -265,196 +319,266 @@ def register_handlers(bot):
                 logger.error(f"Failed to notify user about error: {notify_error}")
 
     @bot.callback_query_handler(func=lambda call: call.data == "end_conversation")
-    def end_conversation_callback(call):
+    @update_executor.serial
+    async def end_conversation_callback(call):
         try:
-            logger.info(f"End conversation callback received: {call.data} from user {call.from_user.id}")
             user_id = call.from_user.id
             chat_id = call.message.chat.id
             message_text = call.message.text if hasattr(call.message, 'text') else ""
 
-            logger.info(f"Message text: {message_text}")
-
-            logger.info(f"Before acknowledging callback query for user {user_id}")
+            await bot.answer_callback_query(call.id)
 
-            bot.answer_callback_query(call.id)
-            logger.info(f"After acknowledging callback query for user {user_id}")
+            await conversation_store.delete(user_id)
 
-            logger.info(f"Ending conversation with user {user_id}")
-
-            logger.info(f"Before removing user from conversation_state, current state: {user_conversation_state}")
-
-            if user_id in user_conversation_state:
-                del user_conversation_state[user_id]
-                logger.info(f"User {user_id} removed from conversation_state")
-            else:
-                logger.warning(f"User {user_id} not found in conversation_state")
-            logger.info(f"After removing user from conversation_state, current state: {user_conversation_state}")
-
-            logger.info(f"Before creating main keyboard for user {user_id}")
             markup = create_main_keyboard()
-            logger.info(f"After creating main keyboard for user {user_id}")
-
 
             is_alternative = "альтернативный вариант" in message_text.lower()
 
-            logger.info(f"Before sending end message to user {user_id}")
             try:
-
                 if is_alternative:
-                    logger.info(f"Trying to edit alternative message for user {user_id}")
                     try:
-
                         raise Exception("Can't edit alternative message with ReplyKeyboardMarkup")
                     except Exception as edit_error:
                         logger.error(f"Error editing alternative message: {edit_error}")
                 else:
-                    logger.info(f"Trying to edit standard message for user {user_id}")
                     try:
-
-                        bot.edit_message_text(
+                        await bot.edit_message_text(
                             chat_id=chat_id,
                             message_id=call.message.message_id,
                             text="Разговор завершен. Отправляю главное меню..."
                         )
-                        logger.info(f"Successfully edited message for user {user_id}")
                     except Exception as edit_error:
                         logger.error(f"Error editing message: {edit_error}")
 
-
-                sent_message = bot.send_message(
+                await bot.send_message(
                     chat_id,
                     "Разговор завершен. Вы можете выбрать другую опцию:",
                     reply_markup=markup
                 )
-                logger.info(f"Sent end message to user {user_id}, message_id: {sent_message.message_id}")
             except Exception as send_error:
                 logger.error(f"Error sending end message: {send_error}")
 
                 try:
-                    bot.send_message(
+                    await bot.send_message(
                         chat_id,
                         "Разговор завершен.",
                         reply_markup=types.ReplyKeyboardRemove()
                     )
-                    logger.info(f"Sent simple end message to user {user_id}")
-
 
-                    bot.send_message(
+                    await bot.send_message(
                         chat_id,
                         "Выберите опцию:",
                         reply_markup=markup
                     )
-                    logger.info(f"Sent main keyboard to user {user_id}")
                 except Exception as simple_error:
                     logger.error(f"Error sending simple end message: {simple_error}")
-
-            logger.info(f"After sending end message to user {user_id}")
         except Exception as e:
-            import traceback
-            error_traceback = traceback.format_exc()
-            logger.error(f"Error in end_conversation_callback: {e}")
-            logger.error(f"Traceback: {error_traceback}")
-
+            logger.exception(f"Error in end_conversation_callback: {e}")
 
             try:
-                bot.send_message(
+                await bot.send_message(
                     call.message.chat.id,
                     "Произошла ошибка при завершении разговора. Пожалуйста, попробуйте позже."
                 )
             except Exception as notify_error:
                 logger.error(f"Failed to notify user about error: {notify_error}")
 
-    @bot.message_handler(func=lambda message: message.from_user.id in user_conversation_state)
-    def conversation_handler(message):
+    @bot.message_handler(func=is_in_conversation)
+    @update_executor.serial
+    async def conversation_handler(message):
         try:
             user_id = message.from_user.id
             chat_id = message.chat.id
 
-            logger.info(f"Processing question from user {user_id}: {message.text}")
-            logger.info(f"User conversation state: {user_conversation_state}")
-
-            logger.info(f"Before creating markup for user {user_id}")
-
-            markup = types.InlineKeyboardMarkup()
-            end_btn = types.InlineKeyboardButton("Завершить разговор", callback_data="end_conversation")
-            markup.add(end_btn)
-            logger.info(f"After creating markup for user {user_id}")
-
-            logger.info(f"Before sending typing action to user {user_id}")
-
-            bot.send_chat_action(chat_id, 'typing')
-            logger.info(f"After sending typing action to user {user_id}")
+            logger.debug(f"Question received: {redact_text(message.text)}")
 
-            logger.info(f"Before calling ask_llm_rag for user {user_id}")
+            # Every question extends the conversation's TTL
+            state = await conversation_store.get(user_id) or {"started_at": time.time()}
+            await conversation_store.set(user_id, state)
 
-            response = ask_llm_rag(message.text)
-            logger.info(f"After calling ask_llm_rag for user {user_id}")
+            question = message.text
+            placeholder_text = "⏳ Ищу ответ на ваш вопрос..."
+            placeholder = await bot.send_message(chat_id, placeholder_text)
 
-            logger.info(f"Received response from LLM RAG API: {response}")
-
-
-            answer = "Извините, я не смог найти ответ на ваш вопрос. Пожалуйста, попробуйте переформулировать вопрос."
-
-            logger.info(f"Before processing response for user {user_id}")
-            if response:
-
-                if 'error' in response and 'detail' in response:
-                    logger.error(f"API returned an error: {response['error']}")
-                    answer = response['detail']
-
-                elif 'detail' in response:
-                    answer = response['detail']
-                elif 'answer' in response:
-                    answer = response['answer']
-                elif 'response' in response:
-                    answer = response['response']
-                elif 'text' in response:
-                    answer = response['text']
-                elif isinstance(response, str):
-                    answer = response
-            logger.info(f"After processing response for user {user_id}")
-
-            logger.info(f"Final answer to user: {answer[:100]}...")
-
-            logger.info(f"Before sending answer to user {user_id}")
-            sent_message = bot.send_message(
-                chat_id,
-                answer,
-                reply_markup=markup
+            context = build_context(state)
+            position = llm_queue.submit(
+                lambda: answer_question(bot, chat_id, question, placeholder, user_id=user_id, context=context)
             )
-            logger.info(f"After sending answer to user {user_id}, message_id: {sent_message.message_id}")
+
+            if position is None:
+                logger.warning(f"LLM job queue is full, rejecting question from user {user_id}")
+                await bot.edit_message_text(
+                    "Сейчас поступает слишком много вопросов. Пожалуйста, попробуйте позже.",
+                    chat_id=chat_id,
+                    message_id=placeholder.message_id,
+                    reply_markup=create_conversation_keyboard()
+                )
+            elif position > 0:
+                logger.info(f"Question from user {user_id} queued at position {position}")
+                await bot.edit_message_text(
+                    f"{placeholder_text}\n\nВаш вопрос в очереди: {position}",
+                    chat_id=chat_id,
+                    message_id=placeholder.message_id
+                )
         except Exception as e:
-            import traceback
-            error_traceback = traceback.format_exc()
-            logger.error(f"Error processing question: {e}")
-            logger.error(f"Traceback: {error_traceback}")
+            logger.exception(f"Error processing question: {e}")
 
             try:
-
-                markup = types.InlineKeyboardMarkup()
-                end_btn = types.InlineKeyboardButton("Завершить разговор", callback_data="end_conversation")
-                markup.add(end_btn)
-
-                bot.send_message(
+                await bot.send_message(
                     chat_id,
                     "Произошла ошибка при обработке вашего вопроса. Пожалуйста, попробуйте позже.",
-                    reply_markup=markup
+                    reply_markup=create_conversation_keyboard()
                 )
             except Exception as notify_error:
                 logger.error(f"Failed to notify user about error: {notify_error}")
 
     @bot.message_handler(func=lambda message: True)
-    def default_handler(message):
+    @update_executor.serial
+    async def default_handler(message):
         markup = create_main_keyboard()
-        bot.send_message(
+        await bot.send_message(
             message.chat.id,
             "Пожалуйста, используйте кнопки для взаимодействия с ботом.",
             reply_markup=markup
         )
-        logger.info(f"Default handler triggered for user {message.from_user.id}")
 
     logger.info("All handlers registered")
 
+async def send_bus_schedule_photo(bot, chat_id, schedule):
+    key = (schedule.get('id'), schedule['image_url'])
+    file_id = bus_schedule_file_ids.get(key)
+    caption = "Актуальное расписание автобусов"
+    if schedule.get('stale'):
+        caption = f"Расписание автобусов\n\n{STALE_DATA_NOTICE}"
+
+    if file_id:
+        try:
+            return await bot.send_photo(chat_id, file_id, caption=caption)
+        except Exception as e:
+            logger.warning(f"Cached bus schedule file_id rejected, uploading by URL: {e}")
+            bus_schedule_file_ids.pop(key, None)
+
+    sent_message = await bot.send_photo(
+        chat_id,
+        schedule['image_url'] + "?download",
+        caption=caption
+    )
+
+    if sent_message and sent_message.photo:
+        # Only the latest schedule is ever sent, so older file_ids can be dropped
+        bus_schedule_file_ids.clear()
+        bus_schedule_file_ids[key] = sent_message.photo[-1].file_id
+    return sent_message
+
+def create_conversation_keyboard():
+    markup = types.InlineKeyboardMarkup()
+    end_btn = types.InlineKeyboardButton("Завершить разговор", callback_data="end_conversation")
+    markup.add(end_btn)
+    return markup
+
+async def keep_typing(bot, chat_id):
+    # Telegram shows a chat action for about 5 seconds, so it has to be repeated while the answer is pending
+    while True:
+        try:
+            await bot.send_chat_action(chat_id, 'typing')
+        except Exception as e:
+            logger.warning(f"Failed to send typing action to chat {chat_id}: {e}")
+        await asyncio.sleep(TYPING_REFRESH_INTERVAL)
+
+async def stream_answer(bot, chat_id, question, placeholder, context=None):
+    answer = ""
+    shown = ""
+    last_edit = 0.0
+    loop = asyncio.get_running_loop()
+
+    async for piece in stream_llm_rag(question, context):
+        answer += piece
+
+        # Edits are throttled to stay well inside Telegram's per-chat rate limits
+        if loop.time() - last_edit < STREAM_EDIT_INTERVAL or answer.strip() == shown:
+            continue
+        try:
+            await bot.edit_message_text(
+                answer[:TELEGRAM_MESSAGE_LIMIT],
+                chat_id=chat_id,
+                message_id=placeholder.message_id
+            )
+            shown = answer.strip()
+        except Exception as e:
+            logger.warning(f"Failed to update streamed answer in chat {chat_id}: {e}")
+        last_edit = loop.time()
+
+    return answer.strip() or extract_answer(None)
+
+async def answer_question(bot, chat_id, question, placeholder, user_id=None, context=None):
+    typing_task = asyncio.create_task(keep_typing(bot, chat_id))
+    answered = False
+    try:
+        if is_streaming_enabled():
+            answer = await stream_answer(bot, chat_id, question, placeholder, context)
+            answered = answer != extract_answer(None)
+        else:
+            response = await ask_llm_rag(question, context)
+            answer = extract_answer(response)
+            answered = isinstance(response, dict) and "error" not in response
+    except LLMStreamError as e:
+        # Whatever was streamed so far is replaced by the error and not remembered as an answer
+        answer = str(e)
+    except Exception as e:
+        logger.error(f"Error asking LLM RAG API: {e}")
+        answer = "Произошла ошибка при обработке вашего вопроса. Пожалуйста, попробуйте позже."
+    finally:
+        typing_task.cancel()
+
+    if answered and user_id is not None:
+        await remember_turn(user_id, question, answer)
+
+    # Long answers go out as several messages; the keyboard stays under the last one
+    parts = split_message(answer)
+    markup = create_conversation_keyboard()
+    rest = parts[1:]
+    try:
+        await bot.edit_message_text(
+            parts[0],
+            chat_id=chat_id,
+            message_id=placeholder.message_id,
+            reply_markup=None if rest else markup
+        )
+    except Exception as edit_error:
+        logger.error(f"Error editing answer message, sending a new one: {edit_error}")
+        rest = parts
+
+    for index, part in enumerate(rest):
+        try:
+            await bot.send_message(chat_id, part, reply_markup=markup if index == len(rest) - 1 else None)
+        except Exception as e:
+            logger.error(f"Error sending answer to chat {chat_id}: {e}")
+            return
+
+def split_message(text, limit=TELEGRAM_MESSAGE_LIMIT):
+    """Cut text into messages of at most limit characters, at a line break or space where possible."""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit + 1)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, limit + 1)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip()
+    if text or not parts:
+        parts.append(text)
+    return parts
+
+async def remember_turn(user_id, question, answer):
+    # The state is re-read because the user may have ended the conversation while waiting
+    try:
+        state = await conversation_store.get(user_id)
+        if state is not None:
+            await conversation_store.set(user_id, append_turn(state, question, answer))
+    except Exception as e:
+        logger.warning(f"Failed to save conversation history for user {user_id}: {e}")
+
 def create_main_keyboard():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     checkin_btn = types.KeyboardButton("Заселение")
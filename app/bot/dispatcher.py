@@ -0,0 +1,86 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Dict
+from telebot.asyncio_helper import ApiTelegramException
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Take one token and return how long to wait before using it; the balance may go negative."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+
+class NotificationDispatcher:
+    """Sends messages within Telegram's global and per-chat rate limits, backing off on 429 retry_after."""
+
+    def __init__(self, global_rate: float = 25.0, chat_rate: float = 1.0, max_retries: int = 3):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.max_retries = max_retries
+        self.paused_until = 0.0
+        self.throttled = 0
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10000:
+                # Buckets that have refilled completely carry no state worth keeping
+                now = time.monotonic()
+                self._chat_buckets = {
+                    key: value for key, value in self._chat_buckets.items()
+                    if value.tokens + (now - value.updated) * value.rate < value.capacity
+                }
+            bucket = TokenBucket(self.chat_rate, 1)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def _acquire(self, chat_id: int):
+        pause = self.paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        delay = max(self.global_bucket.reserve(), self._chat_bucket(chat_id).reserve())
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def send_message(self, bot, chat_id: int, text: str, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id)
+            try:
+                return await bot.send_message(chat_id, text, **kwargs)
+            except ApiTelegramException as e:
+                if e.error_code != 429 or attempt == self.max_retries:
+                    raise
+                retry_after = (e.result_json.get("parameters") or {}).get("retry_after", 1)
+                self.throttled += 1
+                # A 429 means the whole bot is over its limit, so every sender pauses
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+                logger.warning(f"Telegram rate limit hit for chat {chat_id}, retrying after {retry_after}s")
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "throttled": self.throttled,
+            "paused_for": max(0.0, self.paused_until - time.monotonic())
+        }
+
+
+notification_dispatcher = NotificationDispatcher(
+    global_rate=float(os.getenv("TELEGRAM_GLOBAL_RATE", "25")),
+    chat_rate=float(os.getenv("TELEGRAM_CHAT_RATE", "1")),
+    max_retries=int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+)
@@ -0,0 +1,142 @@
+import time
+import asyncio
+import logging
+import functools
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+from telebot import types
+from app.utils.batch import request_memo
+from app.utils.log import log_context
+from app.utils.metrics import handler_latency, dropped_updates
+from app.utils.tracing import start_span, SPAN_KIND_SERVER
+
+logger = logging.getLogger(__name__)
+
+
+def get_chat_id(update) -> int:
+    # Callback queries carry the chat on the message the button belongs to
+    if isinstance(update, types.CallbackQuery):
+        return update.message.chat.id
+    return update.chat.id
+
+
+class ChatExecutor:
+    """Runs update handlers on a fixed number of workers, one update at a time per chat.
+
+    Updates from one chat stay in order, different chats run in parallel, and the total
+    number of queued updates is capped so a flood of taps cannot fan out unbounded work.
+    """
+
+    def __init__(self, workers: int = 16, max_pending: int = 1000, max_pending_per_chat: int = 5):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_pending_per_chat = max_pending_per_chat
+        self.pending = 0
+        self.in_flight = 0
+        self.processed = 0
+        self.dropped = 0
+        self._queues: Dict[int, Deque[Callable[[], Awaitable[Any]]]] = {}
+        self._ready: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Update executor started with {self.workers} workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, chat_id: int, job: Callable[[], Awaitable[Any]]) -> bool:
+        self.start()
+
+        if self.pending >= self.max_pending:
+            self.dropped += 1
+            dropped_updates.inc(reason="executor_full")
+            logger.warning(f"Update executor is full ({self.pending} pending), dropping update from chat {chat_id}")
+            return False
+
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = deque()
+            self._queues[chat_id] = queue
+            self._ready.put_nowait(chat_id)
+        elif len(queue) >= self.max_pending_per_chat:
+            self.dropped += 1
+            dropped_updates.inc(reason="chat_full")
+            logger.warning(f"Too many pending updates from chat {chat_id}, dropping update")
+            return False
+
+        queue.append(job)
+        self.pending += 1
+        return True
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._ready.get()
+            queue = self._queues[chat_id]
+            job = queue.popleft()
+            self.pending -= 1
+            self.in_flight += 1
+            try:
+                await job()
+            except Exception as e:
+                logger.exception(f"Unhandled error while processing update from chat {chat_id}: {e}")
+            finally:
+                self.in_flight -= 1
+                self.processed += 1
+
+            # A chat re-enters the ready queue at the back, so busy chats cannot starve others
+            if queue:
+                self._ready.put_nowait(chat_id)
+            else:
+                del self._queues[chat_id]
+
+    def serial(self, handler: Callable[[Any], Awaitable[Any]]) -> Callable[[Any], Awaitable[None]]:
+        @functools.wraps(handler)
+        async def wrapper(update):
+            chat_id = get_chat_id(update)
+
+            async def job():
+                # One summary line per update; everything logged inside carries the same ids,
+                # and Directus lookups by id are memoized until the update is handled
+                with log_context(update_id=getattr(update, "update_id", None), user_id=update.from_user.id), \
+                        request_memo():
+                    status = "error"
+                    started = time.perf_counter()
+                    try:
+                        # Each update starts a trace; Directus, LLM and Telegram calls become its children
+                        with start_span(
+                            f"update {handler.__name__}",
+                            kind=SPAN_KIND_SERVER,
+                            **{"bot.handler": handler.__name__, "telegram.chat_id": chat_id}
+                        ):
+                            await handler(update)
+                        status = "ok"
+                    finally:
+                        elapsed = time.perf_counter() - started
+                        handler_latency.observe(elapsed, handler=handler.__name__, status=status)
+                        latency_ms = round(elapsed * 1000, 1)
+                        logger.info(
+                            f"Handled update with {handler.__name__}",
+                            extra={"fields": {"handler": handler.__name__, "latency_ms": latency_ms}}
+                        )
+
+            self.submit(chat_id, job)
+
+        return wrapper
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "in_flight": self.in_flight,
+            "active_chats": len(self._queues),
+            "processed": self.processed,
+            "dropped": self.dropped
+        }
@@ -0,0 +1,63 @@
+import os
+import logging
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Recent turns are sent verbatim; older ones are folded into a short running summary
+HISTORY_MAX_TURNS = int(os.getenv("LLM_HISTORY_MAX_TURNS", "6"))
+HISTORY_MAX_CHARS = int(os.getenv("LLM_HISTORY_MAX_CHARS", "3000"))
+SUMMARY_MAX_CHARS = int(os.getenv("LLM_HISTORY_SUMMARY_CHARS", "600"))
+SUMMARY_TURN_CHARS = 150
+
+history_stats = {
+    "turns_recorded": 0,
+    "turns_compacted": 0,
+    "peak_context_chars": 0
+}
+
+
+def context_size(state: Dict[str, Any]) -> int:
+    turns = state.get("history", [])
+    return len(state.get("summary", "")) + sum(len(turn["question"]) + len(turn["answer"]) for turn in turns)
+
+
+def compact_turn(turn: Dict[str, str]) -> str:
+    question = turn["question"][:SUMMARY_TURN_CHARS]
+    answer = turn["answer"][:SUMMARY_TURN_CHARS]
+    return f"В: {question} О: {answer}"
+
+
+def append_turn(state: Dict[str, Any], question: str, answer: str) -> Dict[str, Any]:
+    turns = state.setdefault("history", [])
+    turns.append({"question": question, "answer": answer})
+    history_stats["turns_recorded"] += 1
+
+    def over_budget():
+        return len(turns) > HISTORY_MAX_TURNS or (len(turns) > 1 and context_size(state) > HISTORY_MAX_CHARS)
+
+    while over_budget():
+        oldest = turns.pop(0)
+        summary = f"{state.get('summary', '')}\n{compact_turn(oldest)}".strip()
+        # Keep the most recent part of the summary when it outgrows its budget
+        state["summary"] = summary[-SUMMARY_MAX_CHARS:]
+        history_stats["turns_compacted"] += 1
+
+    # A single oversized answer is trimmed rather than dropped, so the budget is a hard cap
+    overflow = context_size(state) - HISTORY_MAX_CHARS
+    if overflow > 0:
+        turns[-1]["answer"] = turns[-1]["answer"][:max(0, len(turns[-1]["answer"]) - overflow)]
+
+    history_stats["peak_context_chars"] = max(history_stats["peak_context_chars"], context_size(state))
+    return state
+
+
+def build_context(state: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Chat-style messages describing the conversation so far, oldest first."""
+    messages = []
+    if state.get("summary"):
+        messages.append({"role": "system", "content": f"Краткое содержание предыдущего разговора:\n{state['summary']}"})
+    for turn in state.get("history", []):
+        messages.append({"role": "user", "content": turn["question"]})
+        messages.append({"role": "assistant", "content": turn["answer"]})
+    return messages
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from app.utils.log import log_context, current_log_context
+from app.utils.tracing import current_span, use_span
+
+logger = logging.getLogger(__name__)
+
+
+class LLMJobQueue:
+    """FIFO of questions for the RAG backend with a fixed number of concurrent requests."""
+
+    def __init__(self, concurrency: int = 4, max_queued: int = 200):
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.waiting = 0
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        logger.info(f"LLM job queue started with concurrency {self.concurrency}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, job: Callable[[], Awaitable[Any]]) -> Optional[int]:
+        """Queue a job and return its 1-based position, 0 if it starts right away, or None if the queue is full."""
+        self.start()
+
+        if self.waiting >= self.max_queued:
+            self.rejected += 1
+            return None
+
+        position = max(0, self.active + self.waiting - self.concurrency + 1)
+        self.waiting += 1
+        # The job runs on a worker task, so the submitter's log fields and span travel with it
+        self._queue.put_nowait((job, current_log_context(), current_span()))
+        return position
+
+    async def _worker(self):
+        while True:
+            job, fields, span = await self._queue.get()
+            self.waiting -= 1
+            self.active += 1
+            try:
+                with log_context(**fields), use_span(span):
+                    await job()
+            except Exception as e:
+                logger.exception(f"Unhandled error in LLM job: {e}")
+            finally:
+                self.active -= 1
+                self.completed += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "concurrency": self.concurrency,
+            "waiting": self.waiting,
+            "active": self.active,
+            "completed": self.completed,
+            "rejected": self.rejected
+        }
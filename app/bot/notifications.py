@@ -1,24 +1,64 @@
+import asyncio
 import logging
 import os
-from telebot import TeleBot
+import time
+from telebot.asyncio_helper import ApiTelegramException
+from app.bot.dispatcher import notification_dispatcher
+from app.bot.outbox import get_outbox
+from app.services.webapp import get_linked_telegram_ids, recompute_status_snapshots
+from app.services.status_snapshots import status_snapshots, STATUS_KINDS
+from app.utils.log import log_context
+from app.utils.metrics import dead_lettered_notifications
+from app.utils.tracing import start_span, current_traceparent, parse_traceparent, SPAN_KIND_CONSUMER
 
 
 logger = logging.getLogger(__name__)
 
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "2"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "5"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "3600"))
+# Sent notifications and finished bulk jobs are deleted after this many seconds
+OUTBOX_RETENTION = float(os.getenv("OUTBOX_RETENTION", "604800"))
+OUTBOX_PURGE_INTERVAL = float(os.getenv("OUTBOX_PURGE_INTERVAL", "3600"))
+# Re-render the status a check-in/relocation notification is about while the message is being sent
+NOTIFICATION_PREFETCH = os.getenv("NOTIFICATION_PREFETCH", "true").lower() == "true"
 
-def send_notification(bot, user_id, notification_type, message, status=None):
-    try:
+# Telegram errors that will not go away by retrying: the bot was blocked, the account
+# was deleted, or the chat never existed
+PERMANENT_ERROR_MARKERS = (
+    "bot was blocked by the user",
+    "user is deactivated",
+    "chat not found",
+    "bot can't initiate conversation",
+    "bot was kicked"
+)
 
-        formatted_message = format_notification(notification_type, message, status)
+outbox_wakeup = None
+job_tasks = set()
+prefetch_tasks = set()
 
-        bot.send_message(user_id, formatted_message)
 
-        logger.info(f"Notification sent to user {user_id} (type: {notification_type})")
-        return True
+async def send_notification(bot, user_id, notification_type, message, status=None, prefetch=True):
+    formatted_message = format_notification(notification_type, message, status)
 
-    except Exception as e:
-        logger.error(f"Failed to send notification to user {user_id}: {e}")
-        return False
+    if prefetch:
+        prefetch_status(user_id, notification_type)
+    await notification_dispatcher.send_message(bot, user_id, formatted_message)
+
+    logger.info(f"Notification sent to user {user_id} (type: {notification_type})")
+
+def prefetch_status(user_id, notification_type):
+    if not NOTIFICATION_PREFETCH or notification_type not in STATUS_KINDS:
+        return
+
+    # The notification announces a change, so the snapshot is outdated; the user usually taps
+    # the matching button right after reading it
+    status_snapshots.invalidate(notification_type, user_id)
+    task = asyncio.create_task(recompute_status_snapshots([(notification_type, user_id)]))
+    prefetch_tasks.add(task)
+    task.add_done_callback(prefetch_tasks.discard)
 
 def format_notification(notification_type, message, status=None):
     if notification_type == "checkin":
@@ -27,10 +67,139 @@ def format_notification(notification_type, message, status=None):
         header = "📢 Уведомление о переселении"
     else:
         header = "📢 Общее уведомление"
-    
+
     formatted_message = f"{header}\n\n{message}"
-    
+
     # if status:
     #     formatted_message += f"\n\nСтатус: {status}"
-    
-    return formatted_message
\ No newline at end of file
+
+    return formatted_message
+
+async def enqueue_notification(user_id, notification_type, message, status=None):
+    notification_id = await asyncio.to_thread(
+        get_outbox().enqueue, user_id, notification_type, message, status, None, current_traceparent()
+    )
+    wake_outbox_sender()
+
+    logger.info(f"Notification {notification_id} queued for user {user_id} (type: {notification_type})")
+    return notification_id
+
+def wake_outbox_sender():
+    if outbox_wakeup is not None:
+        outbox_wakeup.set()
+
+async def get_notification_status(notification_id):
+    return await asyncio.to_thread(get_outbox().get, notification_id)
+
+def is_permanent_error(error):
+    if isinstance(error, ApiTelegramException) and error.error_code in (400, 403):
+        description = str(error.description).lower()
+        return error.error_code == 403 or any(marker in description for marker in PERMANENT_ERROR_MARKERS)
+    return False
+
+async def deliver_notification(bot, notification):
+    outbox = get_outbox()
+    notification_id = notification["id"]
+    user_id = notification["user_id"]
+
+    try:
+        # Delivery continues the trace of the API request that queued the notification
+        with log_context(user_id=user_id, notification_id=notification_id), start_span(
+            "notification deliver",
+            kind=SPAN_KIND_CONSUMER,
+            parent=parse_traceparent(notification.get("trace_parent")),
+            **{"notification.id": notification_id, "notification.attempt": notification["attempts"] + 1}
+        ):
+            # Bulk announcements reach thousands of users at once, far more than will open their status
+            await send_notification(
+                bot, user_id, notification["notification_type"], notification["message"], notification["status"],
+                prefetch=notification.get("job_id") is None
+            )
+        await asyncio.to_thread(outbox.mark_sent, notification_id)
+
+    except Exception as e:
+        attempts = notification["attempts"] + 1
+        if is_permanent_error(e) or attempts >= OUTBOX_MAX_ATTEMPTS:
+            logger.error(f"Notification {notification_id} to user {user_id} moved to dead letters: {e}")
+            await asyncio.to_thread(outbox.mark_dead, notification_id, user_id, str(e))
+            dead_lettered_notifications.inc(
+                notification_type=notification["notification_type"],
+                reason="permanent_error" if is_permanent_error(e) else "max_attempts"
+            )
+        else:
+            delay = min(OUTBOX_BACKOFF_BASE * (2 ** (attempts - 1)), OUTBOX_BACKOFF_MAX)
+            logger.warning(f"Failed to send notification {notification_id} to user {user_id}, retrying in {delay:.0f}s: {e}")
+            await asyncio.to_thread(outbox.mark_retry, notification_id, str(e), delay)
+
+async def purge_outbox(outbox):
+    try:
+        deleted = await asyncio.to_thread(outbox.purge, time.time() - OUTBOX_RETENTION)
+        if deleted:
+            logger.info(f"Purged {deleted} sent notifications from the outbox")
+    except Exception as e:
+        logger.error(f"Failed to purge notification outbox: {e}")
+
+async def run_outbox_sender(bot):
+    """Drain due outbox rows forever; the dispatcher paces the actual sends."""
+    global outbox_wakeup
+
+    outbox = get_outbox()
+    outbox_wakeup = asyncio.Event()
+    logger.info("Notification outbox sender started")
+    loop = asyncio.get_running_loop()
+    last_purge = loop.time()
+
+    while True:
+        if loop.time() - last_purge >= OUTBOX_PURGE_INTERVAL:
+            last_purge = loop.time()
+            await purge_outbox(outbox)
+
+        try:
+            batch = await asyncio.to_thread(outbox.claim_due, OUTBOX_BATCH_SIZE)
+        except Exception as e:
+            logger.error(f"Failed to read notification outbox: {e}")
+            batch = []
+
+        if batch:
+            await asyncio.gather(*(deliver_notification(bot, notification) for notification in batch))
+            continue
+
+        outbox_wakeup.clear()
+        try:
+            await asyncio.wait_for(outbox_wakeup.wait(), timeout=OUTBOX_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+async def start_bulk_notification(notification_type, message, status=None, user_ids=None, directus_filter=None):
+    job_id = await asyncio.to_thread(get_outbox().create_job, notification_type)
+
+    task = asyncio.create_task(
+        enqueue_bulk_notification(job_id, notification_type, message, status, user_ids, directus_filter)
+    )
+    job_tasks.add(task)
+    task.add_done_callback(job_tasks.discard)
+
+    logger.info(f"Bulk notification job {job_id} queued")
+    return job_id
+
+async def enqueue_bulk_notification(job_id, notification_type, message, status, user_ids, directus_filter):
+    outbox = get_outbox()
+
+    try:
+        if user_ids is None:
+            user_ids = await get_linked_telegram_ids(directus_filter)
+        recipients = list(dict.fromkeys(user_ids))
+
+        await asyncio.to_thread(
+            outbox.enqueue_many, recipients, notification_type, message, status, job_id, current_traceparent()
+        )
+        await asyncio.to_thread(outbox.update_job, job_id, "enqueued")
+        wake_outbox_sender()
+        logger.info(f"Bulk notification job {job_id} enqueued {len(recipients)} notifications")
+
+    except Exception as e:
+        logger.error(f"Bulk notification job {job_id} failed: {e}")
+        await asyncio.to_thread(outbox.update_job, job_id, "failed", str(e))
+
+async def get_notification_job(job_id):
+    return await asyncio.to_thread(get_outbox().get_job, job_id)
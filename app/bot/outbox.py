@@ -0,0 +1,228 @@
+import os
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+STALE_CLAIM_SECONDS = 300
+# Rows deleted per transaction when purging, so senders never wait long for the write lock
+PURGE_BATCH_SIZE = 1000
+
+
+class NotificationOutbox:
+    """SQLite-backed queue of notifications that survives restarts.
+
+    Rows move pending -> sending -> sent, go back to pending with a later next_attempt_at
+    after a transient failure, or end up as dead with a copy in dead_letters.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS notifications (
+                id TEXT PRIMARY KEY,
+                job_id TEXT,
+                user_id INTEGER NOT NULL,
+                notification_type TEXT NOT NULL,
+                message TEXT NOT NULL,
+                status TEXT,
+                trace_parent TEXT,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_notifications_due ON notifications (state, next_attempt_at);
+            CREATE INDEX IF NOT EXISTS idx_notifications_job ON notifications (job_id);
+            CREATE INDEX IF NOT EXISTS idx_notifications_updated ON notifications (state, updated_at);
+            CREATE TABLE IF NOT EXISTS notification_jobs (
+                id TEXT PRIMARY KEY,
+                notification_type TEXT NOT NULL,
+                state TEXT NOT NULL,
+                error TEXT,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS dead_letters (
+                notification_id TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                error TEXT,
+                created_at REAL NOT NULL
+            );
+            """
+        )
+        # Outboxes created before delivery was traced lack the trace_parent column
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(notifications)")}
+        if "trace_parent" not in columns:
+            self._conn.execute("ALTER TABLE notifications ADD COLUMN trace_parent TEXT")
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two workers never claim the same rows
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def enqueue(self, user_id: int, notification_type: str, message: str, status: Optional[str] = None,
+                job_id: Optional[str] = None, trace_parent: Optional[str] = None) -> str:
+        return self.enqueue_many([user_id], notification_type, message, status, job_id, trace_parent)[0]
+
+    def enqueue_many(self, user_ids: Iterable[int], notification_type: str, message: str,
+                     status: Optional[str] = None, job_id: Optional[str] = None,
+                     trace_parent: Optional[str] = None) -> List[str]:
+        now = time.time()
+        rows = [
+            (uuid.uuid4().hex, job_id, user_id, notification_type, message, status, trace_parent, now, now, now)
+            for user_id in user_ids
+        ]
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO notifications (id, job_id, user_id, notification_type, message, status, trace_parent, "
+                "state, next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, 'pending', ?, ?, ?)",
+                rows
+            )
+        return [row[0] for row in rows]
+
+    def claim_due(self, limit: int = 50) -> List[Dict[str, Any]]:
+        now = time.time()
+        with self._transaction() as conn:
+            # Rows claimed by a process that died mid-send are handed out again once the claim is stale
+            rows = conn.execute(
+                "SELECT * FROM notifications WHERE (state = 'pending' AND next_attempt_at <= ?) "
+                "OR (state = 'sending' AND updated_at < ?) ORDER BY next_attempt_at LIMIT ?",
+                (now, now - STALE_CLAIM_SECONDS, limit)
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE notifications SET state = 'sending', updated_at = ? WHERE id = ?",
+                    [(now, row["id"]) for row in rows]
+                )
+        return [dict(row) for row in rows]
+
+    def mark_sent(self, notification_id: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE notifications SET state = 'sent', attempts = attempts + 1, last_error = NULL, updated_at = ? "
+                "WHERE id = ?",
+                (time.time(), notification_id)
+            )
+
+    def mark_retry(self, notification_id: str, error: str, delay: float):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE notifications SET state = 'pending', attempts = attempts + 1, last_error = ?, "
+                "next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                (error, now + delay, now, notification_id)
+            )
+
+    def mark_dead(self, notification_id: str, user_id: int, error: str):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE notifications SET state = 'dead', attempts = attempts + 1, last_error = ?, updated_at = ? "
+                "WHERE id = ?",
+                (error, now, notification_id)
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO dead_letters (notification_id, user_id, error, created_at) VALUES (?, ?, ?, ?)",
+                (notification_id, user_id, error, now)
+            )
+
+    def get(self, notification_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, job_id, user_id, notification_type, state, attempts, last_error, created_at, updated_at "
+                "FROM notifications WHERE id = ?",
+                (notification_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def create_job(self, notification_type: str) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO notification_jobs (id, notification_type, state, created_at) VALUES (?, ?, 'queued', ?)",
+                (job_id, notification_type, time.time())
+            )
+        return job_id
+
+    def update_job(self, job_id: str, state: str, error: Optional[str] = None):
+        with self._lock:
+            self._conn.execute("UPDATE notification_jobs SET state = ?, error = ? WHERE id = ?", (state, error, job_id))
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._conn.execute("SELECT * FROM notification_jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            counts = self._conn.execute(
+                "SELECT state, COUNT(*) AS count FROM notifications WHERE job_id = ? GROUP BY state", (job_id,)
+            ).fetchall()
+
+        progress = {row["state"]: row["count"] for row in counts}
+        result = dict(job)
+        result.update({
+            "total": sum(progress.values()),
+            "sent": progress.get("sent", 0),
+            "pending": progress.get("pending", 0) + progress.get("sending", 0),
+            "failed": progress.get("dead", 0)
+        })
+        return result
+
+    def purge(self, older_than: float) -> int:
+        """Delete sent notifications and finished bulk jobs last touched before older_than; dead ones are kept."""
+        deleted = 0
+        while True:
+            with self._transaction() as conn:
+                count = conn.execute(
+                    "DELETE FROM notifications WHERE id IN (SELECT id FROM notifications "
+                    "WHERE state = 'sent' AND updated_at < ? LIMIT ?)",
+                    (older_than, PURGE_BATCH_SIZE)
+                ).rowcount
+            deleted += count
+            if count < PURGE_BATCH_SIZE:
+                break
+
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM notification_jobs WHERE state IN ('enqueued', 'failed') AND created_at < ? "
+                "AND NOT EXISTS (SELECT 1 FROM notifications WHERE job_id = notification_jobs.id "
+                "AND state IN ('pending', 'sending'))",
+                (older_than,)
+            )
+        return deleted
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counts = self._conn.execute("SELECT state, COUNT(*) AS count FROM notifications GROUP BY state").fetchall()
+        return {row["state"]: row["count"] for row in counts}
+
+
+_outbox: Optional[NotificationOutbox] = None
+
+
+def get_outbox() -> NotificationOutbox:
+    global _outbox
+
+    if _outbox is None:
+        path = os.getenv("NOTIFICATION_OUTBOX_PATH", "notification_outbox.db")
+        _outbox = NotificationOutbox(path)
+        logger.info(f"Notification outbox opened at {path}")
+    return _outbox
@@ -0,0 +1,134 @@
+import os
+import json
+import asyncio
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, Optional
+from app.utils.cache import TTLCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryStateStore:
+    """Per-process store; entries expire after ttl and the least recently active users are evicted first."""
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.cache = TTLCache("conversation_state", maxsize=maxsize, ttl=ttl)
+
+    async def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        state = self.cache.get(user_id)
+        return None if state is MISSING else state
+
+    async def set(self, user_id: int, state: Dict[str, Any]):
+        self.cache.set(user_id, state)
+
+    async def delete(self, user_id: int):
+        self.cache.invalidate(user_id)
+
+    def size(self) -> int:
+        return len(self.cache)
+
+
+class SQLiteStateStore:
+    """Store in a SQLite file, shared by workers on one host and kept across restarts."""
+
+    PURGE_EVERY = 500
+
+    def __init__(self, path: str, ttl: float):
+        self.ttl = ttl
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversation_state ("
+            "user_id INTEGER PRIMARY KEY, state TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    # sqlite3 blocks, so every query runs in a worker thread and the event loop keeps serving updates
+    async def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get, user_id)
+
+    async def set(self, user_id: int, state: Dict[str, Any]):
+        await asyncio.to_thread(self._set, user_id, state)
+
+    async def delete(self, user_id: int):
+        await asyncio.to_thread(self._delete, user_id)
+
+    def _get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM conversation_state WHERE user_id = ? AND expires_at > ?", (user_id, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set(self, user_id: int, state: Dict[str, Any]):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO conversation_state (user_id, state, expires_at) VALUES (?, ?, ?)",
+                (user_id, json.dumps(state), now + self.ttl)
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                self._conn.execute("DELETE FROM conversation_state WHERE expires_at <= ?", (now,))
+
+    def _delete(self, user_id: int):
+        with self._lock:
+            self._conn.execute("DELETE FROM conversation_state WHERE user_id = ?", (user_id,))
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM conversation_state WHERE expires_at > ?", (time.time(),)
+            ).fetchone()[0]
+
+
+class RedisStateStore:
+    """Store in Redis (or any server speaking its protocol), shared by every replica."""
+
+    KEY_PREFIX = "conversation_state:"
+
+    def __init__(self, url: str, ttl: float):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            logger.error("The redis package is required for CONVERSATION_STORE=redis")
+            raise
+
+        self.ttl = ttl
+        self.client = redis.from_url(url)
+
+    async def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        value = await self.client.get(f"{self.KEY_PREFIX}{user_id}")
+        return json.loads(value) if value else None
+
+    async def set(self, user_id: int, state: Dict[str, Any]):
+        await self.client.set(f"{self.KEY_PREFIX}{user_id}", json.dumps(state), ex=int(self.ttl))
+
+    async def delete(self, user_id: int):
+        await self.client.delete(f"{self.KEY_PREFIX}{user_id}")
+
+    def size(self) -> Optional[int]:
+        # Counting keys would need a SCAN over the whole keyspace
+        return None
+
+
+def create_state_store():
+    backend = os.getenv("CONVERSATION_STORE", "memory").lower()
+    ttl = float(os.getenv("CONVERSATION_TTL", "1800"))
+
+    if backend == "memory":
+        store = MemoryStateStore(ttl=ttl, maxsize=int(os.getenv("CONVERSATION_MAX_USERS", "10000")))
+    elif backend == "sqlite":
+        store = SQLiteStateStore(os.getenv("CONVERSATION_SQLITE_PATH", "conversation_state.db"), ttl=ttl)
+    elif backend == "redis":
+        store = RedisStateStore(os.getenv("CONVERSATION_REDIS_URL", "redis://localhost:6379/0"), ttl=ttl)
+    else:
+        raise ValueError(f"Unsupported CONVERSATION_STORE: {backend}")
+
+    logger.info(f"Conversation state store: {backend} (ttl {ttl:.0f}s)")
+    return store
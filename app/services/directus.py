@@ -1,7 +1,16 @@
 import os
+import json
+import time
+import asyncio
 import logging
-import requests
-from typing import Dict, Optional, Any
+import aiohttp
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+from app.utils.cache import TTLCache, MISSING, get_shared_backend
+from app.utils.batch import BatchLoader
+from app.utils.circuit import CircuitBreaker, CircuitOpenError
+from app.utils.singleflight import SingleFlight
+from app.utils.metrics import directus_latency
+from app.utils.tracing import start_span, SPAN_KIND_CLIENT
 
 logger = logging.getLogger(__name__)
 
@@ -20,51 +29,382 @@ def get_directus_token() -> str:
     return token
 
 
-def make_directus_request(endpoint: str, method: str = "GET", params: Optional[Dict[str, Any]] = None) -> Dict[
-    str, Any]:
-    base_url = get_directus_url()
-    token = get_directus_token()
-
-    url = f"{base_url.rstrip('/')}/{endpoint.lstrip('/')}"
-
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
-
-    processed_params = {}
-    if params:
-        for key, value in params.items():
-            if key == "filter" and isinstance(value, dict):
-                # JSON encode the filter object
-                import json
-                processed_params[key] = json.dumps(value)
-            else:
-                processed_params[key] = value
+class DirectusClient:
 
-    try:
-        logger.info(f"Making {method} request to Directus API: {url}")
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
 
-        if method.upper() == "GET":
-            response = requests.get(url, headers=headers, params=processed_params)
-        elif method.upper() == "POST":
-            response = requests.post(url, headers=headers, json=params)
-        else:
+    def __init__(self, base_url: str, token: str, pool_size: int = 10, connect_timeout: float = 3.05,
+                 read_timeout: float = 15.0, max_retries: int = 3, backoff_factor: float = 0.3):
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json"
+        }
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def get_session(self) -> aiohttp.ClientSession:
+        # The session is bound to the running event loop, so it is created on first use
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.pool_size)
+            self._session = aiohttp.ClientSession(headers=self.headers, timeout=self.timeout, connector=connector)
+        return self._session
+
+    def build_url(self, endpoint: str) -> str:
+        return f"{self.base_url}/{endpoint.lstrip('/')}"
+
+    @staticmethod
+    def build_query(params: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        processed_params = {}
+        if params:
+            for key, value in params.items():
+                if key == "filter" and isinstance(value, dict):
+                    # JSON encode the filter object
+                    processed_params[key] = json.dumps(value)
+                elif isinstance(value, (list, tuple)):
+                    processed_params[key] = ",".join(str(item) for item in value)
+                else:
+                    processed_params[key] = str(value)
+        return processed_params
+
+    def get_backoff(self, attempt: int, response: Optional[aiohttp.ClientResponse] = None) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff_factor * (2 ** attempt)
+
+    async def request(self, endpoint: str, method: str = "GET", params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        url = self.build_url(endpoint)
+        method = method.upper()
+
+        if method not in ("GET", "POST"):
             logger.error(f"Unsupported HTTP method: {method}")
             raise ValueError(f"Unsupported HTTP method: {method}")
 
-        response.raise_for_status()
-        return response.json()
+        logger.debug(f"Making {method} request to Directus API: {url}")
+
+        # Only idempotent reads are retried; 5xx/429 responses and connection errors back off exponentially
+        attempts = self.max_retries + 1 if method == "GET" else 1
+        for attempt in range(attempts):
+            is_last_attempt = attempt == attempts - 1
+            try:
+                if method == "GET":
+                    request = self.get_session().get(url, params=self.build_query(params))
+                else:
+                    request = self.get_session().post(url, json=params)
+
+                async with request as response:
+                    if response.status in self.RETRY_STATUSES and not is_last_attempt:
+                        delay = self.get_backoff(attempt, response)
+                        logger.warning(f"Directus API returned {response.status}, retrying in {delay:.2f}s: {url}")
+                        await asyncio.sleep(delay)
+                        continue
+
+                    response.raise_for_status()
+                    return await response.json()
+
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if is_last_attempt:
+                    raise
+                delay = self.get_backoff(attempt)
+                logger.warning(f"Directus API connection error, retrying in {delay:.2f}s: {e}")
+                await asyncio.sleep(delay)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+_directus_client: Optional[DirectusClient] = None
+
+
+def get_directus_client() -> DirectusClient:
+    global _directus_client
+
+    if _directus_client is None:
+        _directus_client = DirectusClient(
+            base_url=get_directus_url(),
+            token=get_directus_token(),
+            pool_size=int(os.getenv("DIRECTUS_POOL_SIZE", "10")),
+            connect_timeout=float(os.getenv("DIRECTUS_CONNECT_TIMEOUT", "3.05")),
+            read_timeout=float(os.getenv("DIRECTUS_READ_TIMEOUT", "15")),
+            max_retries=int(os.getenv("DIRECTUS_MAX_RETRIES", "3")),
+            backoff_factor=float(os.getenv("DIRECTUS_BACKOFF_FACTOR", "0.3"))
+        )
+        logger.info("Directus client initialized")
+    return _directus_client
+
+
+async def close_directus_client():
+    if _directus_client is not None:
+        await _directus_client.close()
 
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error making request to Directus API: {e}")
+
+# Identical concurrent reads (e.g. everyone tapping "Расписание автобусов" at once) share one request.
+# The shared response dict must be treated as read-only by callers.
+directus_flight = SingleFlight("directus")
+
+
+def endpoint_collection(endpoint: str) -> str:
+    # "/items/student_accommodation/5" -> "student_accommodation", "/users" -> "users"
+    parts = [part for part in endpoint.split("/") if part]
+    if len(parts) > 1 and parts[0] == "items":
+        return parts[1]
+    return parts[0] if parts else ""
+
+
+# Upper bound for one Directus call including its retries, so a slow Directus cannot hold handlers
+DIRECTUS_DEADLINE = float(os.getenv("DIRECTUS_DEADLINE", "5"))
+DIRECTUS_CIRCUIT_FAILURES = int(os.getenv("DIRECTUS_CIRCUIT_FAILURES", "5"))
+DIRECTUS_CIRCUIT_RECOVERY = float(os.getenv("DIRECTUS_CIRCUIT_RECOVERY", "30"))
+
+# One breaker per collection: an outage of one collection's permissions or indexes leaves the rest usable
+directus_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_directus_breaker(collection: str) -> CircuitBreaker:
+    breaker = directus_breakers.get(collection)
+    if breaker is None:
+        breaker = CircuitBreaker(f"directus:{collection}", DIRECTUS_CIRCUIT_FAILURES, DIRECTUS_CIRCUIT_RECOVERY)
+        directus_breakers[collection] = breaker
+    return breaker
+
+
+def is_directus_outage(error: BaseException) -> bool:
+    # 4xx answers mean Directus is up and refused this particular request
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status >= 500 or error.status == 429
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+async def timed_directus_request(endpoint: str, method: str, params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    collection = endpoint_collection(endpoint)
+    breaker = get_directus_breaker(collection)
+    status = "error"
+    started = time.perf_counter()
+    try:
+        breaker.before_call()
+    except CircuitOpenError:
+        directus_latency.observe(0.0, collection=collection, method=method.upper(), status="circuit_open")
         raise
 
+    try:
+        with start_span(
+            f"directus {method.upper()} {collection}",
+            kind=SPAN_KIND_CLIENT,
+            **{"directus.collection": collection, "directus.endpoint": endpoint, "http.method": method.upper()}
+        ) as span:
+            try:
+                result = await asyncio.wait_for(
+                    get_directus_client().request(endpoint, method=method, params=params), timeout=DIRECTUS_DEADLINE
+                )
+            except aiohttp.ClientResponseError as e:
+                status = str(e.status)
+                if span is not None:
+                    span.set_attribute("http.status_code", e.status)
+                raise
+        status = "ok"
+        breaker.record_success()
+        return result
+    except Exception as e:
+        if is_directus_outage(e):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        raise
+    finally:
+        breaker.release()
+        directus_latency.observe(
+            time.perf_counter() - started, collection=collection, method=method.upper(), status=status
+        )
 
-def get_bus_schedule() -> Optional[Dict[str, Any]]:
 
+async def make_directus_request(endpoint: str, method: str = "GET", params: Optional[Dict[str, Any]] = None) -> Dict[
+    str, Any]:
     try:
-        response = make_directus_request(
+        if method.upper() == "GET":
+            key = (endpoint, json.dumps(params, sort_keys=True, default=str))
+            return await directus_flight.do(key, lambda: timed_directus_request(endpoint, method, params))
+        return await timed_directus_request(endpoint, method, params)
+
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"Error making request to Directus API: {e!r}")
+        raise
+    except CircuitOpenError as e:
+        logger.debug(f"Directus request to {endpoint} not sent: {e}")
+        raise
+
+
+# Reference data changes a few times a semester, so whole records are cached by collection/id
+REFERENCE_COLLECTIONS = {
+    "student_accommodation",
+    "student_accommodation_type",
+    "student_accommodation_addresses",
+    "student_accommodation_floors",
+    "student_accommodation_apartments_blocks"
+}
+
+reference_cache = TTLCache(
+    "directus_reference",
+    maxsize=int(os.getenv("DIRECTUS_CACHE_MAXSIZE", "2048")),
+    ttl=float(os.getenv("DIRECTUS_CACHE_TTL", "3600")),
+    shared=get_shared_backend(os.getenv("DIRECTUS_CACHE_SQLITE_PATH")),
+    stale_ttl=float(os.getenv("DIRECTUS_CACHE_STALE_TTL", "604800"))
+)
+
+# Appended to answers built from cached data that could not be refreshed
+STALE_DATA_NOTICE = "⚠️ Данные могут быть устаревшими: сервис временно недоступен."
+
+# Refreshes of expired entries run after the caller was answered; one per key at a time
+revalidation_flight = SingleFlight("revalidation")
+revalidation_tasks = set()
+
+
+def revalidate_in_background(key: Hashable, fn: Callable[[], Awaitable[Any]]):
+    task = asyncio.ensure_future(revalidation_flight.do(key, fn))
+    revalidation_tasks.add(task)
+    task.add_done_callback(finish_revalidation)
+
+
+def finish_revalidation(task: asyncio.Future):
+    revalidation_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Background revalidation failed: {task.exception()!r}")
+
+
+# Lookups by id made within this window are merged into one filter[id][_in] request per collection
+DIRECTUS_BATCH_WINDOW = float(os.getenv("DIRECTUS_BATCH_WINDOW_MS", "2")) / 1000
+# Keeps the query string of a batch well below URL length limits
+DIRECTUS_BATCH_MAX_SIZE = int(os.getenv("DIRECTUS_BATCH_MAX_SIZE", "100"))
+
+item_loaders: Dict[Tuple[str, Tuple[str, ...]], BatchLoader] = {}
+
+
+def get_item_loader(collection: str, fields: Optional[List[str]] = None) -> BatchLoader:
+    fields_key = tuple(fields or ["*"])
+    loader = item_loaders.get((collection, fields_key))
+    if loader is None:
+        async def load_many(item_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+            params: Dict[str, Any] = {"filter": {"id": {"_in": item_ids}}, "limit": len(item_ids)}
+            if fields:
+                # The id is needed to hand each record back to the caller that asked for it
+                params["fields"] = list(fields_key) if {"id", "*"} & set(fields_key) else ["id", *fields_key]
+            response = await make_directus_request(endpoint=f"/items/{collection}", params=params)
+            records = (response.get("data") or []) if response else []
+            return {str(record.get("id")): record for record in records}
+
+        loader = BatchLoader(
+            f"directus:{collection}" + (f"[{','.join(fields_key)}]" if fields else ""),
+            load_many, window=DIRECTUS_BATCH_WINDOW, max_batch_size=DIRECTUS_BATCH_MAX_SIZE
+        )
+        item_loaders[(collection, fields_key)] = loader
+    return loader
+
+
+async def get_item(collection: str, item_id: Any, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    if collection not in REFERENCE_COLLECTIONS:
+        return await get_item_loader(collection, fields).load(str(item_id))
+
+    key = (collection, str(item_id))
+    cached = await reference_cache.get_async(key)
+    if cached is not MISSING:
+        return cached
+
+    stale = reference_cache.get_stale(key)
+    if stale is not MISSING:
+        # Reference data changes a few times a semester: answer with the expired record right away
+        revalidate_in_background(key, lambda: load_reference_item(collection, item_id))
+        return stale
+    return await load_reference_item(collection, item_id)
+
+
+async def load_reference_item(collection: str, item_id: Any) -> Optional[Dict[str, Any]]:
+    # Cached records are shared by all callers, so fetch every top-level field once
+    data = await get_item_loader(collection, ["*"]).load(str(item_id))
+    if data is not None:
+        await reference_cache.set_async((collection, str(item_id)), data)
+    return data
+
+
+async def get_items_by_ids(collection: str, item_ids: List[Any],
+                           fields: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """Several records of one collection, keyed by str(id); misses are fetched together in one request."""
+    unique_ids = list(dict.fromkeys(str(item_id) for item_id in item_ids if item_id is not None))
+    records = await asyncio.gather(*(get_item(collection, item_id, fields) for item_id in unique_ids))
+    return {item_id: record for item_id, record in zip(unique_ids, records) if record is not None}
+
+
+# Only dormitories are read through get_item (relocation statuses); check-in expands its whole
+# room tree in one nested query, so the other reference collections are never looked up by id
+WARMUP_COLLECTIONS = ("student_accommodation",)
+
+
+async def warm_up_reference_collection(collection: str) -> int:
+    # At most half the cache, so a large collection cannot evict the entries requests put there
+    limit = max(reference_cache.maxsize // 2, 1)
+    response = await make_directus_request(
+        endpoint=f"/items/{collection}",
+        params={"fields": ["*"], "limit": limit}
+    )
+    records = (response.get("data") or []) if response else []
+    if len(records) >= limit:
+        logger.warning(f"Warm-up of {collection} stopped at {limit} records, the rest is loaded on demand")
+    for record in records:
+        await reference_cache.set_async((collection, str(record.get("id"))), record)
+    return len(records)
+
+
+async def invalidate_reference_cache(collection: Optional[str] = None, item_id: Optional[Any] = None):
+    if collection is None or item_id is None:
+        # Shared entries cannot be matched by collection, so drop the (small) cache entirely
+        await reference_cache.clear_async()
+        logger.info(f"Reference cache cleared (collection: {collection})")
+    else:
+        await reference_cache.invalidate_async((collection, str(item_id)))
+        logger.info(f"Reference cache entry invalidated: {collection}/{item_id}")
+
+
+# Latest schedule record; polled at most once per TTL, or dropped early by a Directus flow hook
+bus_schedule_cache = TTLCache(
+    "bus_schedule",
+    maxsize=1,
+    ttl=float(os.getenv("BUS_SCHEDULE_CACHE_TTL", "60")),
+    stale_ttl=float(os.getenv("BUS_SCHEDULE_STALE_TTL", "604800"))
+)
+
+
+def invalidate_bus_schedule():
+    # Expired rather than dropped, so it can still be served while Directus is unavailable
+    bus_schedule_cache.expire("latest")
+    logger.info("Bus schedule cache invalidated")
+
+
+async def get_bus_schedule() -> Optional[Dict[str, Any]]:
+    cached = bus_schedule_cache.get("latest")
+    if cached is not MISSING:
+        return cached
+
+    try:
+        schedule = await fetch_bus_schedule()
+    except Exception:
+        stale = bus_schedule_cache.get_stale("latest")
+        if stale is MISSING:
+            return None
+        logger.warning("Directus is unavailable, serving the last known bus schedule")
+        return {**stale, "stale": True}
+
+    if schedule is not None:
+        bus_schedule_cache.set("latest", schedule)
+    return schedule
+
+
+async def fetch_bus_schedule() -> Optional[Dict[str, Any]]:
+
+    try:
+        response = await make_directus_request(
             endpoint="/items/bus_schedule",
             params={
                 "sort": "-date_created",
@@ -81,7 +421,6 @@ def get_bus_schedule() -> Optional[Dict[str, Any]]:
         schedule = response["data"][0]
         
 
-        directus_url = get_directus_url()
         image_id = schedule.get("image")
         
         if not image_id:
@@ -104,4 +443,21 @@ def get_bus_schedule() -> Optional[Dict[str, Any]]:
     
     except Exception as e:
         logger.error(f"Error fetching bus schedule from Directus: {e}")
-        return None
\ No newline at end of file
+        raise
+
+
+async def warm_up_caches():
+    """Preload dormitories and the latest bus schedule, so the first users after a deploy hit warm caches."""
+    started = time.perf_counter()
+    collections = WARMUP_COLLECTIONS
+    results = await asyncio.gather(
+        *(warm_up_reference_collection(collection) for collection in collections),
+        get_bus_schedule(),
+        return_exceptions=True
+    )
+
+    for collection, result in zip(collections, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Failed to warm up {collection}: {result!r}")
+    loaded = sum(result for result in results[:-1] if isinstance(result, int))
+    logger.info(f"Caches warmed up with {loaded} reference records in {time.perf_counter() - started:.2f}s")
@@ -1,7 +1,18 @@
 import os
+import re
+import time
+import json
+import math
+import asyncio
 import logging
-import requests
-from typing import Dict, Optional, Any
+import aiohttp
+from collections import Counter
+from typing import AsyncIterator, Dict, List, Optional, Any, Tuple
+from app.utils.cache import TTLCache, MISSING
+from app.utils.singleflight import SingleFlight
+from app.utils.log import redact_text
+from app.utils.metrics import llm_latency
+from app.utils.tracing import start_span, SPAN_KIND_CLIENT, STATUS_ERROR
 
 logger = logging.getLogger(__name__)
 
@@ -13,7 +24,179 @@ def get_llm_rag_url() -> str:
     return url
 
 
-def ask_llm_rag(question: str) -> Dict[str, Any]:
+LLM_RAG_DIRECTORY = "instruction_documents"
+LLM_UNAVAILABLE_MESSAGE = "Не удалось подключиться к серверу нейросети. Пожалуйста, попробуйте позже."
+
+
+class LLMStreamError(Exception):
+    """Raised by stream_llm_rag when no complete answer can be given; the message is meant for the user.
+
+    Pieces yielded before the error are only part of an answer and must not be shown or kept as one.
+    """
+
+
+def normalize_question(question: str) -> str:
+    text = question.lower().replace("ё", "е")
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def question_vector(text: str) -> Counter:
+    # Character trigrams are a cheap local embedding that tolerates typos and word order changes
+    padded = f" {text} "
+    return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+# Words that flip a question's meaning while barely changing its trigrams
+NEGATION_WORDS = frozenset(("не", "нет", "без"))
+
+
+def question_signature(text: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """Numbers and negations of a normalized question; similar questions only match if these are equal."""
+    words = text.split()
+    numbers = tuple(re.findall(r"\d+", text))
+    negations = tuple(sorted(word for word in words if word in NEGATION_WORDS))
+    return numbers, negations
+
+
+def cosine_similarity(a: Counter, b: Counter) -> float:
+    dot = sum(count * b[gram] for gram, count in a.items() if gram in b)
+    norm = math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values()))
+    return dot / norm if norm else 0.0
+
+
+def parse_directory_ttls(value: str) -> Dict[str, float]:
+    ttls = {}
+    for item in value.split(","):
+        if "=" in item:
+            directory, ttl = item.split("=", 1)
+            ttls[directory.strip()] = float(ttl)
+    return ttls
+
+
+class AnswerCache:
+    """Answers keyed by normalized question text, with an optional similarity lookup for near-duplicates."""
+
+    def __init__(self, maxsize: int = 1000, ttl: float = 3600.0, directory_ttls: Optional[Dict[str, float]] = None,
+                 similarity_threshold: float = 0.0):
+        self.cache = TTLCache("llm_answers", maxsize=maxsize, ttl=ttl)
+        self.directory_ttls = directory_ttls or {}
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._vectors: Dict[Tuple[str, str], Tuple[Counter, Tuple]] = {}
+
+    def get(self, directory: str, question: str) -> Optional[str]:
+        normalized = normalize_question(question)
+        answer = self.cache.get((directory, normalized))
+        if answer is not MISSING:
+            self.hits += 1
+            return answer
+
+        if self.similarity_threshold > 0:
+            vector = question_vector(normalized)
+            signature = question_signature(normalized)
+            best_key, best_score = None, self.similarity_threshold
+            for key, (candidate, candidate_signature) in list(self._vectors.items()):
+                # "нужны"/"не нужны" or "общежитие 3"/"общежитие 5" score above 0.9 yet need other answers
+                if key[0] != directory or candidate_signature != signature:
+                    continue
+                score = cosine_similarity(vector, candidate)
+                if score >= best_score:
+                    best_key, best_score = key, score
+
+            if best_key is not None:
+                answer = self.cache.get(best_key)
+                if answer is not MISSING:
+                    self.hits += 1
+                    self.similar_hits += 1
+                    logger.info(f"Answer cache matched a similar question (score {best_score:.2f})")
+                    return answer
+                self._vectors.pop(best_key, None)
+
+        self.misses += 1
+        return None
+
+    def set(self, directory: str, question: str, answer: str):
+        normalized = normalize_question(question)
+        key = (directory, normalized)
+        self.cache.set(key, answer, ttl=self.directory_ttls.get(directory))
+
+        if self.similarity_threshold > 0:
+            self._vectors[key] = (question_vector(normalized), question_signature(normalized))
+            if len(self._vectors) > self.cache.maxsize:
+                # Drop vectors of answers the LRU has already evicted or expired
+                self._vectors = {k: v for k, v in self._vectors.items() if k in self.cache}
+
+    def purge(self, directory: Optional[str] = None) -> int:
+        if directory is None:
+            count = len(self.cache)
+            self.cache.clear()
+            self._vectors.clear()
+        else:
+            count = self.cache.invalidate_where(lambda key: key[0] == directory)
+            self._vectors = {k: v for k, v in self._vectors.items() if k[0] != directory}
+        logger.info(f"Purged {count} cached answers (directory: {directory or 'all'})")
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.cache),
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+answer_cache = AnswerCache(
+    maxsize=int(os.getenv("LLM_CACHE_MAXSIZE", "1000")),
+    ttl=float(os.getenv("LLM_CACHE_TTL", "3600")),
+    directory_ttls=parse_directory_ttls(os.getenv("LLM_CACHE_TTLS", "")),
+    similarity_threshold=float(os.getenv("LLM_CACHE_SIMILARITY", "0"))
+)
+
+
+def is_streaming_enabled() -> bool:
+    return os.getenv("LLM_RAG_STREAMING", "false").lower() in ("1", "true", "yes")
+
+
+_llm_rag_session: Optional[aiohttp.ClientSession] = None
+
+
+def get_llm_rag_session() -> aiohttp.ClientSession:
+    global _llm_rag_session
+
+    if _llm_rag_session is None or _llm_rag_session.closed:
+        _llm_rag_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=300))
+    return _llm_rag_session
+
+
+async def close_llm_rag_session():
+    if _llm_rag_session is not None and not _llm_rag_session.closed:
+        await _llm_rag_session.close()
+
+
+# Concurrent identical questions wait for one RAG request instead of each starting their own
+llm_flight = SingleFlight("llm_rag")
+
+
+async def ask_llm_rag(question: str, history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
+    # A follow-up's answer depends on the conversation, so only standalone questions are shared
+    if history:
+        return await request_llm_rag(question, history)
+
+    cached_answer = answer_cache.get(LLM_RAG_DIRECTORY, question)
+    if cached_answer is not None:
+        return {"answer": cached_answer}
+
+    key = (LLM_RAG_DIRECTORY, normalize_question(question))
+    return await llm_flight.do(key, lambda: request_llm_rag(question))
+
+
+async def request_llm_rag(question: str, history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
 
     base_url = get_llm_rag_url()
 
@@ -26,30 +209,218 @@ def ask_llm_rag(question: str) -> Dict[str, Any]:
 
     payload = {
         "question": question,
-        "directory": "instruction_documents"
+        "directory": LLM_RAG_DIRECTORY
     }
+    if history:
+        payload["history"] = history
+
+    with start_span(
+        "llm_rag ask", kind=SPAN_KIND_CLIENT, **{"llm.directory": LLM_RAG_DIRECTORY, "llm.history_messages": len(history or [])}
+    ) as span:
+        status = "error"
+        started = time.perf_counter()
+        try:
+            logger.debug(f"Sending question to LLM RAG API: {redact_text(question)}")
+
+            async with get_llm_rag_session().post(url, headers=headers, json=payload) as response:
+                response_text = await response.text()
+                status = str(response.status)
+                logger.info(
+                    f"LLM RAG API responded with {response.status}",
+                    extra={"fields": {
+                        "status": response.status,
+                        "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+                        "response_chars": len(response_text)
+                    }}
+                )
+
+                response.raise_for_status()
+
+
+                try:
+                    result = json.loads(response_text)
+                except ValueError as json_err:
+                    logger.error(f"Error parsing JSON response: {json_err}")
+
+                    return {"text": response_text}
+
+                if isinstance(result, dict) and "error" not in result and not history:
+                    answer_cache.set(LLM_RAG_DIRECTORY, question, extract_answer(result))
+                return result
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Error making request to LLM RAG API: {e!r}")
+
+            return {"error": str(e), "detail": LLM_UNAVAILABLE_MESSAGE}
+        finally:
+            llm_latency.observe(time.perf_counter() - started, mode="ask", status=status)
+            if span is not None:
+                span.set_attribute("http.status_code", status)
+                if status != "200":
+                    span.status = STATUS_ERROR
+
+
+def extract_answer(response: Any) -> str:
+    answer = "Извините, я не смог найти ответ на ваш вопрос. Пожалуйста, попробуйте переформулировать вопрос."
+
+    if response:
+
+        if isinstance(response, str):
+            answer = response
+        elif 'error' in response and 'detail' in response:
+            logger.error(f"API returned an error: {response['error']}")
+            answer = response['detail']
+
+        elif 'detail' in response:
+            answer = response['detail']
+        elif 'answer' in response:
+            answer = response['answer']
+        elif 'response' in response:
+            answer = response['response']
+        elif 'text' in response:
+            answer = response['text']
 
+    return answer
+
+
+def parse_stream_chunk(data: str) -> str:
+    # Chunks are either plain text or JSON objects carrying the next piece of the answer
     try:
-        logger.info(f"Sending question to LLM RAG API: {question}")
-        logger.info(f"API URL: {url}")
+        chunk = json.loads(data)
+    except ValueError:
+        return data
+
+    if isinstance(chunk, dict):
+        for key in ("token", "delta", "text", "answer", "content"):
+            if isinstance(chunk.get(key), str):
+                return chunk[key]
+        return ""
+    # Bare JSON scalars such as "2024" are text that happens to parse as JSON
+    return chunk if isinstance(chunk, str) else data
+
+
+async def iter_sse_data(content: aiohttp.StreamReader) -> AsyncIterator[str]:
+    """Yield the data of each server-sent event, following the event stream format.
+
+    One optional space after "data:" is removed, several data lines of an event are joined
+    with "\n", and an event is complete at the blank line that ends it.
+    """
+    data_lines: List[str] = []
+    async for raw_line in content:
+        line = raw_line.decode("utf-8")
+        if line.endswith("\n"):
+            line = line[:-1]
+        if line.endswith("\r"):
+            line = line[:-1]
+
+        if not line:
+            if data_lines:
+                yield "\n".join(data_lines)
+                data_lines = []
+            continue
+
+        field, _, value = line.partition(":")
+        if field != "data":
+            continue
+        if value.startswith(" "):
+            value = value[1:]
+        data_lines.append(value)
+
+    # A stream that ends without the final blank line still delivers its last event
+    if data_lines:
+        yield "\n".join(data_lines)
+
 
-        response = requests.post(url, headers=headers, json=payload, timeout=300)
+async def stream_llm_rag(question: str, history: Optional[List[Dict[str, str]]] = None) -> AsyncIterator[str]:
+    """Yield the answer in pieces as the RAG backend generates it.
 
-        logger.info(f"API response status code: {response.status_code}")
+    Server-sent events and newline-delimited JSON are streamed; a plain JSON answer
+    from a backend without streaming support is yielded as a single piece. Failures,
+    including ones after some pieces were yielded, raise LLMStreamError.
+    """
 
-        logger.info(f"API response text: {response.text[:500]}...")
+    base_url = get_llm_rag_url()
+
+    url = f"{base_url.rstrip('/')}/ask"
 
-        response.raise_for_status()
+    payload = {
+        "question": question,
+        "directory": LLM_RAG_DIRECTORY,
+        "stream": True
+    }
+    if history:
+        payload["history"] = history
 
+    cached_answer = answer_cache.get(LLM_RAG_DIRECTORY, question) if not history else None
+    if cached_answer is not None:
+        yield cached_answer
+        return
 
+    pieces = []
+    # Not made current: the generator hands control back to its consumer between chunks
+    with start_span(
+        "llm_rag stream", kind=SPAN_KIND_CLIENT, activate=False,
+        **{"llm.directory": LLM_RAG_DIRECTORY, "llm.history_messages": len(history or [])}
+    ) as span:
+        status = "error"
+        started = time.perf_counter()
         try:
-            return response.json()
-        except ValueError as json_err:
-            logger.error(f"Error parsing JSON response: {json_err}")
+            logger.debug(f"Streaming question to LLM RAG API: {redact_text(question)}")
+
+            async with get_llm_rag_session().post(url, json=payload, headers={"Accept": "text/event-stream"}) as response:
+                status = str(response.status)
+                response.raise_for_status()
+                content_type = response.content_type
+
+                if content_type == "text/event-stream":
+                    async for data in iter_sse_data(response.content):
+                        if data == "[DONE]":
+                            break
+                        piece = parse_stream_chunk(data)
+                        if piece:
+                            pieces.append(piece)
+                            yield piece
+
+                elif content_type in ("application/x-ndjson", "application/jsonl"):
+                    async for line in response.content:
+                        # Only the line terminator is dropped; whitespace inside a chunk belongs to the answer
+                        line = line.decode("utf-8").rstrip("\r\n")
+                        piece = parse_stream_chunk(line) if line.strip() else ""
+                        if piece:
+                            pieces.append(piece)
+                            yield piece
+
+                elif content_type == "text/plain":
+                    # Not a streaming format: the body is the answer exactly as sent
+                    response_text = await response.text()
+                    if response_text:
+                        pieces.append(response_text)
+                        yield response_text
 
-            return {"text": response.text}
+                else:
+                    response_text = await response.text()
+                    try:
+                        result = json.loads(response_text)
+                    except ValueError:
+                        yield response_text
+                        return
+                    if isinstance(result, dict) and "error" in result:
+                        raise LLMStreamError(extract_answer(result))
+                    pieces.append(extract_answer(result))
+                    yield pieces[-1]
 
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error making request to LLM RAG API: {e}")
+            answer = "".join(pieces)
+            if answer.strip() and not history:
+                answer_cache.set(LLM_RAG_DIRECTORY, question, answer)
 
-        return {"error": str(e), "detail": "Не удалось подключиться к серверу нейросети. Пожалуйста, попробуйте позже."}
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Error streaming from LLM RAG API after {len(pieces)} chunks: {e!r}")
+            raise LLMStreamError(LLM_UNAVAILABLE_MESSAGE) from e
+        finally:
+            # Measured until the last chunk, i.e. the time the user waits for the full answer
+            llm_latency.observe(time.perf_counter() - started, mode="stream", status=status)
+            if span is not None:
+                span.set_attribute("http.status_code", status)
+                span.set_attribute("llm.answer_chars", sum(len(piece) for piece in pieces))
+                if status != "200":
+                    span.status = STATUS_ERROR
@@ -0,0 +1,142 @@
+import os
+import logging
+import threading
+from typing import Any, Dict, Iterable, Set, Tuple
+
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# (kind, telegram_id), kind being "checkin" or "relocation"
+SnapshotKey = Tuple[str, int]
+# (collection, str(id)) of a Directus record a snapshot was rendered from
+RecordKey = Tuple[str, str]
+
+STATUS_KINDS = ("checkin", "relocation")
+
+
+class StatusSnapshotStore:
+    """Rendered status messages per Telegram user, with an index of the Directus records behind each one.
+
+    Change events name records, so the index tells which users have to be recomputed. The TTL only
+    bounds staleness when an event is missed or reference data (rooms, dormitories) changes.
+
+    Index entries live exactly as long as their snapshot is cached, so every structure here is
+    bounded by maxsize.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, stale_ttl: float):
+        self.maxsize = maxsize
+        self._snapshots = TTLCache(
+            "status_snapshots", maxsize=maxsize, ttl=ttl, stale_ttl=stale_ttl, on_evict=self._forget
+        )
+        # Snapshots known to be outdated by a change event, as opposed to merely past their TTL
+        self._invalidated: Set[SnapshotKey] = set()
+        self._records: Dict[RecordKey, Set[SnapshotKey]] = {}
+        self._depends_on: Dict[SnapshotKey, Set[RecordKey]] = {}
+        # Bumped on invalidation, so a render that started before a change event is not stored
+        self._versions: Dict[SnapshotKey, int] = {}
+        self._epoch = 0
+        # Reentrant: an eviction caused by put() calls back into _forget
+        self._lock = threading.RLock()
+        self.refreshed = 0
+
+    def get(self, kind: str, telegram_id: int) -> Any:
+        return self._snapshots.get((kind, telegram_id))
+
+    def get_stale(self, kind: str, telegram_id: int) -> Tuple[Any, bool]:
+        """The last rendered message, kept for stale_ttl after it expired, and whether an event outdated it."""
+        key = (kind, telegram_id)
+        with self._lock:
+            invalidated = key in self._invalidated
+        return self._snapshots.get_stale(key), invalidated
+
+    def version(self, kind: str, telegram_id: int) -> Tuple[int, int]:
+        return self._epoch, self._versions.get((kind, telegram_id), 0)
+
+    def put(self, kind: str, telegram_id: int, message: str, records: Iterable[Tuple[str, Any]] = (),
+            version: Tuple[int, int] = (0, 0)) -> bool:
+        key = (kind, telegram_id)
+        with self._lock:
+            if (self._epoch, self._versions.get(key, 0)) != version:
+                return False
+            self._snapshots.set(key, message)
+            self._invalidated.discard(key)
+            self._unindex(key)
+            depends_on = {(collection, str(record_id)) for collection, record_id in records if record_id is not None}
+            self._depends_on[key] = depends_on
+            for record in depends_on:
+                self._records.setdefault(record, set()).add(key)
+        return True
+
+    def users_of(self, collection: str, record_ids: Iterable[Any]) -> Set[SnapshotKey]:
+        with self._lock:
+            return {key for record_id in record_ids for key in self._records.get((collection, str(record_id)), ())}
+
+    def invalidate(self, kind: str, telegram_id: int):
+        key = (kind, telegram_id)
+        with self._lock:
+            self._bump(key)
+            if key in self._depends_on:
+                # Kept as a stale fallback for when the status cannot be rendered again
+                self._snapshots.expire(key)
+                self._invalidated.add(key)
+                self._unindex(key)
+
+    def discard(self, kind: str, telegram_id: int):
+        """Forget the snapshot, stale fallback included, for when it no longer belongs to the user."""
+        key = (kind, telegram_id)
+        with self._lock:
+            self._bump(key)
+            self._snapshots.invalidate(key)
+            self._invalidated.discard(key)
+            self._unindex(key)
+
+    def discard_user(self, telegram_id: int):
+        for kind in STATUS_KINDS:
+            self.discard(kind, telegram_id)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._versions.clear()
+            self._invalidated.update(self._depends_on)
+            self._snapshots.expire_where(lambda key: True)
+            self._records.clear()
+            self._depends_on.clear()
+        logger.info("Status snapshots cleared")
+
+    def _bump(self, key: SnapshotKey):
+        if len(self._versions) >= self.maxsize:
+            # A new epoch outdates every render in flight, so the counters can start over
+            self._versions.clear()
+            self._epoch += 1
+        self._versions[key] = self._versions.get(key, 0) + 1
+
+    def _forget(self, key: SnapshotKey):
+        with self._lock:
+            self._invalidated.discard(key)
+            self._unindex(key)
+
+    def _unindex(self, key: SnapshotKey):
+        for record in self._depends_on.pop(key, ()):
+            users = self._records.get(record)
+            if users is not None:
+                users.discard(key)
+                if not users:
+                    del self._records[record]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._snapshots.stats(),
+            "indexed_records": len(self._records),
+            "versions": len(self._versions),
+            "refreshed": self.refreshed
+        }
+
+
+status_snapshots = StatusSnapshotStore(
+    maxsize=int(os.getenv("STATUS_SNAPSHOT_MAXSIZE", "20000")),
+    ttl=float(os.getenv("STATUS_SNAPSHOT_TTL", "21600")),
+    stale_ttl=float(os.getenv("STATUS_SNAPSHOT_STALE_TTL", "604800"))
+)
@@ -1,371 +1,440 @@
 import os
+import asyncio
 import logging
-from typing import Dict, Optional, Any
-from app.services.directus import make_directus_request
+from typing import Dict, Iterable, List, Optional, Set, Any, Tuple
+from app.services.directus import (
+    make_directus_request, get_item, get_items_by_ids, revalidate_in_background, STALE_DATA_NOTICE
+)
+from app.utils.cache import TTLCache, MISSING
+from app.utils.circuit import CircuitOpenError
+from app.services.status_snapshots import status_snapshots, SnapshotKey
 from urllib.parse import quote
 
 
 logger = logging.getLogger(__name__)
 
-def check_checkin_status(user_id: int) -> str:
+# Telegram ID -> system user_id. Unlinked accounts are cached as None for a shorter time,
+# and the web app pushes invalidations when a user links or unlinks an account.
+user_link_cache = TTLCache(
+    "telegram_user_links",
+    maxsize=int(os.getenv("USER_LINK_CACHE_MAXSIZE", "10000")),
+    ttl=float(os.getenv("USER_LINK_CACHE_TTL", "300")),
+    stale_ttl=float(os.getenv("USER_LINK_STALE_TTL", "86400"))
+)
+USER_LINK_NEGATIVE_TTL = float(os.getenv("USER_LINK_NEGATIVE_CACHE_TTL", "30"))
 
-    try:
 
-        user_response = make_directus_request(
+async def get_system_user_id(telegram_id: int) -> Optional[str]:
+    cached = user_link_cache.get(telegram_id)
+    if cached is not MISSING:
+        return cached
+
+    try:
+        user_response = await make_directus_request(
             endpoint="/items/telegram_user_links",
             params={
                 "filter": {
-                    "telegram_id": {"_eq": user_id}
+                    "telegram_id": {"_eq": telegram_id}
                 },
                 "fields": ["user_id"]
             }
         )
+    except Exception:
+        # Links rarely change; the last known one lets statuses render from the remaining collections
+        stale = user_link_cache.get_stale(telegram_id)
+        if stale is MISSING:
+            raise
+        return stale
+
+    if not user_response or "data" not in user_response or not user_response["data"]:
+        user_link_cache.set(telegram_id, None, ttl=USER_LINK_NEGATIVE_TTL)
+        return None
+
+    system_user_id = user_response["data"][0]["user_id"]
+    user_link_cache.set(telegram_id, system_user_id)
+    return system_user_id
+
+
+async def get_linked_telegram_ids(directus_filter: Optional[Dict[str, Any]] = None) -> List[int]:
+    response = await make_directus_request(
+        endpoint="/items/telegram_user_links",
+        params={
+            "filter": directus_filter or {},
+            "fields": ["telegram_id"],
+            "limit": -1
+        }
+    )
+
+    if not response or "data" not in response:
+        return []
+    return [link["telegram_id"] for link in response["data"] if link.get("telegram_id")]
+
+
+def invalidate_user_link(telegram_id: int):
+    user_link_cache.invalidate(telegram_id)
+    # Rendered for the previous link, so not even a stale fallback
+    status_snapshots.discard_user(telegram_id)
+    logger.info(f"User link cache invalidated for Telegram user {telegram_id}")
+
+FLOOR_FIELDS = [
+    "floor_number",
+    "accommodation_id.name",
+    "accommodation_id.type.name",
+    "accommodation_address.city",
+    "accommodation_address.street",
+    "accommodation_address.building_number",
+    "accommodation_address.house_structure",
+    "accommodation_address.corpus"
+]
+
+# Whole room -> block -> floor -> accommodation/type/address tree, expanded by Directus in one request
+CHECKIN_FIELDS = [
+    "room_id.room_number",
+    "room_id.max_capacity",
+    "room_id.apartments_blocks_id.number",
+    *[f"room_id.apartments_blocks_id.floor_id.{field}" for field in FLOOR_FIELDS],
+    *[f"room_id.floor_id.{field}" for field in FLOOR_FIELDS]
+]
+
+
+def format_address(address_data: Optional[Dict[str, Any]]) -> str:
+    if not address_data:
+        return "Неизвестно"
+
+    city = address_data.get("city", "")
+    street = address_data.get("street", "")
+    building_number = address_data.get("building_number", "")
+    house_structure = address_data.get("house_structure", "")
+    corpus = address_data.get("corpus", "")
+
+    address_parts = []
+    if city:
+        address_parts.append(city)
+    if street:
+        address_parts.append(street)
+    if building_number:
+        address_parts.append(f"д. {building_number}")
+    if house_structure:
+        address_parts.append(f"стр. {house_structure}")
+    if corpus:
+        address_parts.append(f"корп. {corpus}")
+
+    return ", ".join(address_parts) if address_parts else "Неизвестно"
+
+
+async def render_checkin_status(user_id: int) -> Tuple[str, List[Tuple[str, Any]]]:
+    """The check-in message and the Directus records it was built from, none if it must not be kept."""
+    system_user_id = await get_system_user_id(user_id)
+
+    if not system_user_id:
+        return "❌ Ваш Telegram аккаунт не привязан к системе. Пожалуйста, привяжите аккаунт.", []
+    records = [("directus_users", system_user_id)]
+
+
+    occupation_response = await make_directus_request(
+        endpoint="/items/student_accommodation_room_occupations",
+        params={
+            "filter": {
+                "user_id": {"_eq": system_user_id}
+            },
+            "fields": ["id", *CHECKIN_FIELDS],
+            "limit": 1
+        }
+    )
 
 
-        if not user_response or "data" not in user_response or not user_response["data"]:
-            return "❌ Ваш Telegram аккаунт не привязан к системе. Пожалуйста, привяжите аккаунт."
-
-
-        system_user_id = user_response["data"][0]["user_id"]
-
+    if not occupation_response or "data" not in occupation_response or not occupation_response["data"]:
+        return "❌ Вы не заселены. Пожалуйста, обратитесь в администрацию общежития.", records
 
-        occupation_response = make_directus_request(
-            endpoint="/items/student_accommodation_room_occupations",
-            params={
-                "filter": {
-                    "user_id": {"_eq": system_user_id}
-                },
-                "fields": ["room_id"]
-            }
-        )
 
+    occupation = occupation_response["data"][0]
+    records.append(("student_accommodation_room_occupations", occupation.get("id")))
+    room_data = occupation.get("room_id")
 
-        if not occupation_response or "data" not in occupation_response or not occupation_response["data"]:
-            return "❌ Вы не заселены. Пожалуйста, обратитесь в администрацию общежития."
+    if not isinstance(room_data, dict):
+        # An error, not a status: no records, so it is not kept as a snapshot
+        return "⚠️ Не удалось получить информацию о комнате. Пожалуйста, попробуйте позже.", []
 
+    room_number = room_data.get("room_number", "Неизвестно")
+    max_capacity = room_data.get("max_capacity", "Неизвестно")
+    floor_data = room_data.get("floor_id")
+    apartment_number = None
 
-        room_id = occupation_response["data"][0]["room_id"]
 
+    apartment_data = room_data.get("apartments_blocks_id")
+    if isinstance(apartment_data, dict):
+        apartment_number = apartment_data.get("number", "Неизвестно")
+        floor_data = apartment_data.get("floor_id")
 
-        room_response = make_directus_request(
-            endpoint=f"/items/student_accommodation_rooms/{room_id}",
-            params={
-                "fields": ["room_number", "max_capacity", "apartments_blocks_id", "floor_id"]
-            }
-        )
 
-        if not room_response or "data" not in room_response:
-            return "⚠️ Не удалось получить информацию о комнате. Пожалуйста, попробуйте позже."
+    floor_number = "Неизвестно"
+    accommodation_name = "Неизвестно"
+    accommodation_type = "Неизвестно"
+    address = "Неизвестно"
 
-        room_data = room_response["data"]
-        room_number = room_data.get("room_number", "Неизвестно")
-        max_capacity = room_data.get("max_capacity", "Неизвестно")
-        apartments_blocks_id = room_data.get("apartments_blocks_id")
-        floor_id = room_data.get("floor_id")
+    if isinstance(floor_data, dict):
+        floor_number = floor_data.get("floor_number", "Неизвестно")
+        if isinstance(floor_number, int):
+            floor_number += 1
 
+        accommodation_data = floor_data.get("accommodation_id")
+        if isinstance(accommodation_data, dict):
+            accommodation_name = accommodation_data.get("name", "Неизвестно")
 
-        floor_number = "Неизвестно"
-        accommodation_id = None
-        accommodation_address_id = None
-        apartment_number = None
+            type_data = accommodation_data.get("type")
+            if isinstance(type_data, dict):
+                accommodation_type = type_data.get("name", "Неизвестно")
 
+        address = format_address(floor_data.get("accommodation_address"))
 
-        if apartments_blocks_id:
-            apartment_response = make_directus_request(
-                endpoint=f"/items/student_accommodation_apartments_blocks/{apartments_blocks_id}",
-                params={
-                    "fields": ["number", "floor_id"]
-                }
-            )
+    yandex_maps_url = f"https://yandex.ru/maps/?text={quote(address)}"
 
-            if apartment_response and "data" in apartment_response:
-                apartment_data = apartment_response["data"]
-                apartment_number = apartment_data.get("number", "Неизвестно")
-                floor_id = apartment_data.get("floor_id")
+    message = f"<b>✅ Вы заселены!</b>\n\n"
+    message += f"<b>Общежитие:</b> {accommodation_name}\n"
+    message += f"<b>Тип:</b> {accommodation_type}\n"
+    message += f"<b>Адрес:</b> <a href=\"{yandex_maps_url}\">{address}</a>\n"
+    message += f"<b>Этаж:</b> {floor_number}\n"
 
+    if apartment_number:
+        message += f"<b>Номер квартиры/блока:</b> {apartment_number}\n"
 
-        if floor_id:
-            floor_response = make_directus_request(
-                endpoint=f"/items/student_accommodation_floors/{floor_id}",
-                params={
-                    "fields": ["floor_number", "accommodation_id","accommodation_address"]
-                }
-            )
+    message += f"<b>Номер комнаты:</b> {room_number}\n"
+    message += f"<b>Вместимость комнаты:</b> {max_capacity} чел."
 
-            if floor_response and "data" in floor_response:
-                floor_data = floor_response["data"]
-                floor_number = floor_data.get("floor_number", "Неизвестно")
-                if isinstance(floor_number, int):
-                    floor_number += 1
-                accommodation_id = floor_data.get("accommodation_id")
-                accommodation_address_id = floor_data.get("accommodation_address")
+    return message, records
 
 
-        accommodation_name = "Неизвестно"
-        accommodation_type = "Неизвестно"
+async def check_checkin_status(user_id: int) -> str:
+    return await read_status(
+        "checkin", user_id, "⚠️ Не удалось получить информацию о заселении. Пожалуйста, попробуйте позже."
+    )
 
-        if accommodation_id:
-            accommodation_response = make_directus_request(
-                endpoint=f"/items/student_accommodation/{accommodation_id}",
-                params={
-                    "fields": ["name", "type"]
-                }
-            )
 
-            if accommodation_response and "data" in accommodation_response:
-                accommodation_data = accommodation_response["data"]
-                accommodation_name = accommodation_data.get("name", "Неизвестно")
-                accommodation_type_id = accommodation_data.get("type")
+async def render_relocation_status(user_id: int) -> Tuple[str, List[Tuple[str, Any]]]:
+    """The relocation message and the Directus records it was built from, none if it must not be kept."""
+    system_user_id = await get_system_user_id(user_id)
 
+    if not system_user_id:
+        return "❌ Ваш Telegram аккаунт не привязан к системе. Пожалуйста, привяжите аккаунт.", []
+    records = [("directus_users", system_user_id)]
 
-                if accommodation_type_id:
-                    type_response = make_directus_request(
-                        endpoint=f"/items/student_accommodation_type/{accommodation_type_id}",
-                        params={
-                            "fields": ["name"]
-                        }
-                    )
 
-                    if type_response and "data" in type_response:
-                        accommodation_type = type_response["data"].get("name", "Неизвестно")
+    application_response = await make_directus_request(
+        endpoint="/items/student_relocation_applications",
+        params={
+            "filter": {
+                "user_created": {"_eq": system_user_id}
+            },
+            "fields": [
+                "id", 
+                "status", 
+                "student_relocation_id", 
+                "student_accommodation_id_from", 
+                "student_accommodation_from_address_id", 
+                "room_number", 
+                "apartment_number", 
+                "floor"
+            ],
+            "sort": ["-date_created"],
+        }
+    )
 
 
-        address = "Неизвестно"
+    if not application_response or "data" not in application_response or not application_response["data"]:
+        return "ℹ️ У вас нет активных заявок на переселение. Вы можете создать заявку в личном кабинете.", records
 
-        if accommodation_address_id:
-            address_response = make_directus_request(
-                endpoint=f"/items/student_accommodation_addresses/{accommodation_address_id}",
-                params={
-                    "fields": ["city", "street", "building_number", "house_structure", "corpus"]
-                }
-            )
 
-            if address_response and "data" in address_response:
-                address_data = address_response["data"]
-                city = address_data.get("city", "")
-                street = address_data.get("street", "")
-                building_number = address_data.get("building_number", "")
-                house_structure = address_data.get("house_structure", "")
-                corpus = address_data.get("corpus", "")
-
-
-                address_parts = []
-                if city:
-                    address_parts.append(city)
-                if street:
-                    address_parts.append(street)
-                if building_number:
-                    address_parts.append(f"д. {building_number}")
-                if house_structure:
-                    address_parts.append(f"стр. {house_structure}")
-                if corpus:
-                    address_parts.append(f"корп. {corpus}")
-
-                address = ", ".join(address_parts) if address_parts else "Неизвестно"
-                yandex_maps_url = f"https://yandex.ru/maps/?text={quote(address)}"
-
-        message = f"<b>✅ Вы заселены!</b>\n\n"
-        message += f"<b>Общежитие:</b> {accommodation_name}\n"
-        message += f"<b>Тип:</b> {accommodation_type}\n"
-        message += f"<b>Адрес:</b> <a href=\"{yandex_maps_url}\">{address}</a>\n"
-        message += f"<b>Этаж:</b> {floor_number}\n"
-
-        if apartment_number:
-            message += f"<b>Номер квартиры/блока:</b> {apartment_number}\n"
-
-        message += f"<b>Номер комнаты:</b> {room_number}\n"
-        message += f"<b>Вместимость комнаты:</b> {max_capacity} чел."
+    application = application_response["data"][0]
+    application_id = application.get("id")
+    records.append(("student_relocation_applications", application_id))
+    application_status = application.get("status", "В обработке")
 
-        return message
 
-    except Exception as e:
-        logger.error(f"Error checking check-in status for user {user_id}: {e}")
-        return "⚠️ Не удалось получить информацию о заселении. Пожалуйста, попробуйте позже."
+    status_map = {
+        "created": "Создана заявка на переселение",
+        "rejected": "Отклонена заявка",
+        "ended": "Заявка на переселение закончена",
+        "canceled": "Заявка отменена пользователем"
+    }
 
-def check_relocation_status(user_id: int) -> str:
+    status_text = status_map.get(application_status, application_status)
 
-    try:
 
-        user_response = make_directus_request(
-            endpoint="/items/telegram_user_links",
+    # The relocation name and the matches only depend on the application, so both go out at once;
+    # the matches bring the counterpart application along instead of two follow-up requests
+    relocation_id = application.get("student_relocation_id")
+    relocation, matches_response = await asyncio.gather(
+        get_item("student_relocation", relocation_id, ["name"]) if relocation_id else asyncio.sleep(0),  # -> None
+        make_directus_request(
+            endpoint="/items/student_relocation_applications_match",
             params={
                 "filter": {
-                    "telegram_id": {"_eq": user_id}
+                    "relocation_applications_id_to": {"_eq": application_id}
                 },
-                "fields": ["user_id"]
+                "fields": [
+                    "id",
+                    "status",
+                    "relocation_applications_id_from.id",
+                    "relocation_applications_id_from.student_accommodation_id_from"
+                ]
             }
         )
+    )
 
+    relocation_name = (relocation or {}).get("name") or "Неизвестно"
 
-        if not user_response or "data" not in user_response or not user_response["data"]:
-            return "❌ Ваш Telegram аккаунт не привязан к системе. Пожалуйста, привяжите аккаунт."
-
+    matches = (matches_response.get("data") or []) if matches_response else []
+    matches_count = len(matches)
+    approved_match = next((match for match in matches if match.get("status") == "approved"), None)
 
-        system_user_id = user_response["data"][0]["user_id"]
+    message = "<b>✅ У вас есть заявка на переселение</b>\n\n"
+    message += f"<b>Переселение:</b> {relocation_name.replace('<p>', '').replace('</p>', '')}\n"
+    message += f"<b>Статус:</b> {status_text}\n"
+    message += f"<b>Количество заявок на вашу комнату:</b> {matches_count}\n"
 
+    if application_status == "ended" and approved_match:
+        from_application = approved_match.get("relocation_applications_id_from") or {}
+        records.append(("student_relocation_applications", from_application.get("id")))
+        from_accommodation_id = from_application.get("student_accommodation_id_from")
+        to_accommodation_id = application.get("student_accommodation_id_from")
 
-        application_response = make_directus_request(
-            endpoint="/items/student_relocation_applications",
-            params={
-                "filter": {
-                    "user_created": {"_eq": system_user_id}
-                },
-                "fields": [
-                    "id", 
-                    "status", 
-                    "student_relocation_id", 
-                    "student_accommodation_id_from", 
-                    "student_accommodation_from_address_id", 
-                    "room_number", 
-                    "apartment_number", 
-                    "floor"
-                ],
-                "sort": ["-date_created"],
-            }
+        # Both dormitories in one filter[id][_in] request, or none when they are already cached
+        accommodations = await get_items_by_ids(
+            "student_accommodation", [from_accommodation_id, to_accommodation_id], ["name"]
         )
+        from_accommodation = accommodations.get(str(from_accommodation_id)) or {}
+        to_accommodation = accommodations.get(str(to_accommodation_id)) or {}
 
+        message += f"\n<b>Вы переселяетесь:</b>\n"
+        message += f"Из: {from_accommodation.get('name', 'Неизвестно')}\n"
+        message += f"В: {to_accommodation.get('name', 'Неизвестно')}\n"
 
-        if not application_response or "data" not in application_response or not application_response["data"]:
-            return "ℹ️ У вас нет активных заявок на переселение. Вы можете создать заявку в личном кабинете."
+    return message, records
 
 
-        application = application_response["data"][0]
-        application_id = application.get("id")
-        application_status = application.get("status", "В обработке")
+async def check_relocation_status(user_id: int) -> str:
+    return await read_status(
+        "relocation", user_id, "⚠️ Не удалось получить информацию о переселении. Пожалуйста, попробуйте позже."
+    )
 
 
-        status_map = {
-            "created": "Создана заявка на переселение",
-            "rejected": "Отклонена заявка",
-            "ended": "Заявка на переселение закончена",
-            "canceled": "Заявка отменена пользователем"
-        }
+STATUS_RENDERERS = {
+    "checkin": render_checkin_status,
+    "relocation": render_relocation_status
+}
 
-        status_text = status_map.get(application_status, application_status)
+# Collections whose change events affect a status: the status kind, and fields of a changed record
+# that point at other records a snapshot may have been rendered from
+SNAPSHOT_SOURCES = {
+    "student_accommodation_room_occupations": ("checkin", {"user_id": "directus_users"}),
+    "student_relocation_applications": ("relocation", {"user_created": "directus_users"}),
+    "student_relocation_applications_match": ("relocation", {
+        "relocation_applications_id_to": "student_relocation_applications",
+        "relocation_applications_id_from": "student_relocation_applications"
+    })
+}
 
+SNAPSHOT_REFRESH_CONCURRENCY = int(os.getenv("STATUS_SNAPSHOT_REFRESH_CONCURRENCY", "4"))
+# Shared by webhook refreshes and notification prefetches; created on first use inside the event loop
+_refresh_semaphore: Optional[asyncio.Semaphore] = None
 
-        relocation_name = "Неизвестно"
-        if application.get("student_relocation_id"):
-            relocation_response = make_directus_request(
-                endpoint=f"/items/student_relocation/{application['student_relocation_id']}",
-                params={
-                    "fields": ["name"]
-                }
-            )
 
-            if relocation_response and "data" in relocation_response:
-                relocation_name = relocation_response["data"].get("name", "Неизвестно")
+# Rendering a status takes up to four Directus round trips; past this the user gets the stale copy
+STATUS_DEADLINE = float(os.getenv("STATUS_DEADLINE", "8"))
 
 
-        matches_response = make_directus_request(
-            endpoint="/items/student_relocation_applications_match",
-            params={
-                "filter": {
-                    "relocation_applications_id_to": {"_eq": application_id}
-                },
-                "fields": ["id", "status"]
-            }
-        )
-        print(matches_response)
-        matches_count = 0
-        if matches_response and "data" in matches_response:
-            matches_count = len(matches_response["data"])
-
-
-        approved_match = None
-        if matches_response and "data" in matches_response:
-            for match in matches_response["data"]:
-                if match.get("status") == "approved":
-                    approved_match = match
-                    break
-
-        message = "<b>✅ У вас есть заявка на переселение</b>\n\n"
-        message += f"<b>Переселение:</b> {relocation_name.replace('<p>', '').replace('</p>', '')}\n"
-        message += f"<b>Статус:</b> {status_text}\n"
-        message += f"<b>Количество заявок на вашу комнату:</b> {matches_count}\n"
-        print(application_status)
-        print(
-            approved_match)
-        if application_status == "ended" and approved_match:
-            print('123')
-            match_id = approved_match.get("id")
-            match_response = make_directus_request(
-                endpoint=f"/items/student_relocation_applications_match/{match_id}",
-                params={
-                    "fields": ["relocation_applications_id_from"]
-                }
-            )
+async def refresh_status(kind: str, telegram_id: int) -> str:
+    version = status_snapshots.version(kind, telegram_id)
+    message, records = await STATUS_RENDERERS[kind](telegram_id)
+    if not records:
+        # No change event names what such a message depends on (an unlinked account, an error), so it
+        # would be served for the whole snapshot TTL; the negative link cache keeps rendering it cheap
+        status_snapshots.discard(kind, telegram_id)
+        return message
+    status_snapshots.put(kind, telegram_id, message, records, version=version)
+    return message
 
-            if match_response and "data" in match_response:
-                from_application_id = match_response["data"].get("relocation_applications_id_from")
-
-
-                from_application_response = make_directus_request(
-                    endpoint=f"/items/student_relocation_applications/{from_application_id}",
-                    params={
-                        "fields": [
-                            "student_accommodation_id_from", 
-                            "student_accommodation_from_address_id",
-                            "user_created"
-                        ]
-                    }
-                )
-
-                if from_application_response and "data" in from_application_response:
-                    from_application = from_application_response["data"]
-
-
-                    from_accommodation_id = from_application.get("student_accommodation_id_from")
-                    from_accommodation_name = "Неизвестно"
-
-                    if from_accommodation_id:
-                        from_accommodation_response = make_directus_request(
-                            endpoint=f"/items/student_accommodation/{from_accommodation_id}",
-                            params={
-                                "fields": ["name"]
-                            }
-                        )
-
-                        if from_accommodation_response and "data" in from_accommodation_response:
-                            from_accommodation_name = from_accommodation_response["data"].get("name", "Неизвестно")
-
-                    to_accommodation_id = application.get("student_accommodation_id_from")
-                    to_accommodation_name = "Неизвестно"
-
-                    if to_accommodation_id:
-                        to_accommodation_response = make_directus_request(
-                            endpoint=f"/items/student_accommodation/{to_accommodation_id}",
-                            params={
-                                "fields": ["name"]
-                            }
-                        )
-
-                        if to_accommodation_response and "data" in to_accommodation_response:
-                            to_accommodation_name = to_accommodation_response["data"].get("name", "Неизвестно")
-
-                    match_user_id = from_application.get("user_created")
-                    match_user_name = "Неизвестный пользователь"
-
-                    if match_user_id:
-                        user_response = make_directus_request(
-                            endpoint=f"/users/{match_user_id}",
-                            params={
-                                "fields": ["first_name", "last_name"]
-                            }
-                        )
-
-                        if user_response and "data" in user_response:
-                            user_data = user_response["data"]
-                            first_name = user_data.get("first_name", "")
-                            last_name = user_data.get("last_name", "")
-                            match_user_name = f"{first_name} {last_name}".strip() or "Неизвестный пользователь"
-
-                    message += f"\n<b>Вы переселяетесь:</b>\n"
-                    message += f"Из: {from_accommodation_name}</a>\n"
-                    message += f"В: {to_accommodation_name}</a>\n"
 
-        return message
+async def read_status(kind: str, telegram_id: int, error_message: str) -> str:
+    cached = status_snapshots.get(kind, telegram_id)
+    if cached is not MISSING:
+        return cached
+
+    stale, invalidated = status_snapshots.get_stale(kind, telegram_id)
+    if stale is not MISSING and not invalidated:
+        # Only past its TTL: changes arrive as events, so the copy is almost certainly still right
+        revalidate_in_background((kind, telegram_id), lambda: refresh_status(kind, telegram_id))
+        return stale
 
+    try:
+        return await asyncio.wait_for(refresh_status(kind, telegram_id), timeout=STATUS_DEADLINE)
+    except CircuitOpenError as e:
+        # Expected for as long as the outage lasts, so not an error of its own
+        logger.warning(f"Status {kind} for user {telegram_id} not rendered: {e}")
     except Exception as e:
-        logger.error(f"Error checking relocation status for user {user_id}: {e}")
-        return "⚠️ Не удалось получить информацию о переселении. Пожалуйста, попробуйте позже."
+        logger.error(f"Error checking {kind} status for user {telegram_id}: {e!r}")
+
+    if stale is MISSING:
+        return error_message
+    revalidate_in_background((kind, telegram_id), lambda: refresh_status(kind, telegram_id))
+    return f"{stale}\n\n<i>{STALE_DATA_NOTICE}</i>"
+
+
+async def invalidate_status_snapshots(collection: str, keys: List[Any], payload: Any = None,
+                                      deleted: bool = False) -> Set[SnapshotKey]:
+    """Drop the snapshots a change of these records affects and return their keys.
+
+    Snapshots rendered from the records are found in the index. A created record, or one whose
+    owner changed, is not there yet, so its owner fields are read from the payload and, unless the
+    records were deleted, from Directus.
+    """
+    kind, owner_fields = SNAPSHOT_SOURCES[collection]
+    affected = status_snapshots.users_of(collection, keys)
+
+    changed = [payload] if isinstance(payload, dict) else []
+    if keys and not deleted:
+        try:
+            response = await make_directus_request(
+                endpoint=f"/items/{collection}",
+                params={
+                    "filter": {"id": {"_in": keys}},
+                    "fields": ["id", *owner_fields],
+                    "limit": len(keys)
+                }
+            )
+            changed.extend((response.get("data") or []) if response else [])
+        except Exception as e:
+            # The indexed snapshots are still dropped; a new owner's status expires by TTL
+            logger.warning(f"Failed to read owners of changed {collection} records {keys}: {e!r}")
+
+    for record in changed:
+        for field, target in owner_fields.items():
+            value = record.get(field)
+            if isinstance(value, dict):
+                value = value.get("id")
+            if value is not None:
+                affected |= status_snapshots.users_of(target, [value])
+
+    affected = {key for key in affected if key[0] == kind}
+    for snapshot_kind, telegram_id in affected:
+        status_snapshots.invalidate(snapshot_kind, telegram_id)
+    logger.info(f"{len(affected)} status snapshots invalidated by {collection} change {keys}")
+    return affected
+
+
+async def recompute_status_snapshots(snapshot_keys: Iterable[SnapshotKey]):
+    global _refresh_semaphore
+
+    if _refresh_semaphore is None:
+        _refresh_semaphore = asyncio.Semaphore(SNAPSHOT_REFRESH_CONCURRENCY)
+
+    async def recompute(kind: str, telegram_id: int):
+        async with _refresh_semaphore:
+            try:
+                await refresh_status(kind, telegram_id)
+                status_snapshots.refreshed += 1
+            except Exception as e:
+                # The next read renders the status again
+                logger.warning(f"Failed to recompute {kind} status for user {telegram_id}: {e!r}")
+
+    await asyncio.gather(*(recompute(kind, telegram_id) for kind, telegram_id in snapshot_keys))
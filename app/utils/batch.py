@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_loaders: List["BatchLoader"] = []
+
+# Futures of every load made while handling one request, keyed by (loader, key)
+_request_memo: contextvars.ContextVar = contextvars.ContextVar("request_memo", default=None)
+
+
+@contextmanager
+def request_memo():
+    """Within the block, repeated loads of a key return the first result without another lookup.
+
+    The memo lives for one request, so it never serves data older than the request itself, and
+    tasks spawned inside the block share it.
+    """
+    token = _request_memo.set({})
+    try:
+        yield
+    finally:
+        _request_memo.reset(token)
+
+
+class BatchLoader:
+    """Collects loads of single keys made within a short window and resolves them with one batch call.
+
+    load_many receives the distinct keys and returns a mapping key -> value; keys it leaves out
+    resolve to None. Concurrent loads of a key that is already queued or in flight share its future.
+    """
+
+    def __init__(self, name: str, load_many: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]],
+                 window: float = 0.0, max_batch_size: int = 100):
+        self.name = name
+        self.load_many = load_many
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.loads = 0
+        self.batches = 0
+        self.deduplicated = 0
+        self.memo_hits = 0
+        self._queued: Dict[Hashable, asyncio.Future] = {}
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._flush_handle: Optional[asyncio.Handle] = None
+        _loaders.append(self)
+
+    async def load(self, key: Hashable) -> Any:
+        self.loads += 1
+        memo = _request_memo.get()
+        memo_key = (self.name, key)
+
+        if memo is not None and memo_key in memo:
+            self.memo_hits += 1
+            future = memo[memo_key]
+        else:
+            future = self._queued.get(key) or self._inflight.get(key)
+            if future is not None:
+                self.deduplicated += 1
+            else:
+                future = self._enqueue(key)
+            if memo is not None:
+                memo[memo_key] = future
+
+        # Shielded, so one caller being cancelled does not fail the batch for everyone else
+        return await asyncio.shield(future)
+
+    def _enqueue(self, key: Hashable) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queued[key] = future
+
+        if len(self._queued) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            # With no window the batch is sent once every task that is ready this tick has run
+            if self.window > 0:
+                self._flush_handle = loop.call_later(self.window, self._flush)
+            else:
+                self._flush_handle = loop.call_soon(self._flush)
+        return future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._queued:
+            return
+
+        batch, self._queued = self._queued, {}
+        self._inflight.update(batch)
+        self.batches += 1
+        asyncio.ensure_future(self._dispatch(batch))
+
+    async def _dispatch(self, batch: Dict[Hashable, asyncio.Future]):
+        try:
+            values = await self.load_many(list(batch))
+        except Exception as e:
+            logger.debug(f"Batch load in {self.name} failed: {e!r}")
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+                    # Mark the exception as retrieved even if every waiter has gone away
+                    future.add_done_callback(lambda done: done.exception())
+        else:
+            for key, future in batch.items():
+                if not future.done():
+                    future.set_result(values.get(key))
+        finally:
+            for key, future in batch.items():
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "loads": self.loads,
+            "batches": self.batches,
+            "deduplicated": self.deduplicated,
+            "memo_hits": self.memo_hits,
+            "queued": len(self._queued),
+            "in_flight": len(self._inflight)
+        }
+
+
+def get_batch_loader_stats() -> List[Dict[str, Any]]:
+    return [loader.stats() for loader in _loaders]
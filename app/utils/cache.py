@@ -0,0 +1,282 @@
+import json
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Returned by get() when a key is absent, so that None can be cached as a value
+MISSING = object()
+
+_caches: List["TTLCache"] = []
+
+
+class SQLiteCacheBackend:
+    """Shared cache tier stored in a SQLite file, so several bot replicas on one host share warm entries."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+
+    def get(self, namespace: str, key: str) -> Tuple[Any, float]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        if not row:
+            return MISSING, 0.0
+        value, expires_at = row
+        if expires_at <= time.time():
+            return MISSING, 0.0
+        return json.loads(value), expires_at
+
+    def set(self, namespace: str, key: str, value: Any, expires_at: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), expires_at)
+            )
+
+    def delete(self, namespace: str, key: Optional[str] = None):
+        with self._lock:
+            if key is None:
+                self._conn.execute("DELETE FROM cache WHERE namespace = ?", (namespace,))
+            else:
+                self._conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+
+
+class TTLCache:
+    """In-process LRU cache with per-entry TTL and an optional shared second tier.
+
+    With stale_ttl, expired entries are kept that much longer for get_stale(), so callers can
+    answer from the last known value while the source is unavailable.
+
+    The shared tier is a blocking SQLite file: code running in the event loop uses the *_async
+    methods, which reach it from a worker thread.
+
+    on_evict is called with the key of every entry the cache drops on its own (LRU or past
+    stale_ttl), outside the cache lock; explicit invalidate/clear calls do not trigger it.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 300.0,
+                 shared: Optional[SQLiteCacheBackend] = None, stale_ttl: float = 0.0,
+                 on_evict: Optional[Callable[[Hashable], None]] = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared = shared
+        self.stale_ttl = stale_ttl
+        self.on_evict = on_evict
+        self.stale_hits = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        _caches.append(self)
+
+    @staticmethod
+    def _shared_key(key: Hashable) -> str:
+        return json.dumps(key, default=str)
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        value = self._get_local(key)
+        if value is MISSING and self.shared is not None:
+            value = self._get_shared(key)
+        return self._count(value, default)
+
+    async def get_async(self, key: Hashable, default: Any = MISSING) -> Any:
+        value = self._get_local(key)
+        if value is MISSING and self.shared is not None:
+            value = await asyncio.to_thread(self._get_shared, key)
+        return self._count(value, default)
+
+    def _get_local(self, key: Hashable) -> Any:
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            expires_at, value = entry
+            if expires_at > now:
+                self._data.move_to_end(key)
+                return value
+            if expires_at + self.stale_ttl > now:
+                return MISSING
+            del self._data[key]
+        self._evicted([key])
+        return MISSING
+
+    def _get_shared(self, key: Hashable) -> Any:
+        try:
+            value, expires_at = self.shared.get(self.name, self._shared_key(key))
+        except sqlite3.Error as e:
+            logger.error(f"Error reading shared cache {self.name}: {e}")
+            return MISSING
+        if value is not MISSING:
+            with self._lock:
+                evicted = self._store(key, value, expires_at)
+            self._evicted(evicted)
+        return value
+
+    def _count(self, value: Any, default: Any) -> Any:
+        with self._lock:
+            if value is MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires_at = self._set_local(key, value, ttl)
+        if self.shared is not None:
+            self._set_shared(key, value, expires_at)
+
+    async def set_async(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires_at = self._set_local(key, value, ttl)
+        if self.shared is not None:
+            await asyncio.to_thread(self._set_shared, key, value, expires_at)
+
+    def _set_local(self, key: Hashable, value: Any, ttl: Optional[float]) -> float:
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            evicted = self._store(key, value, expires_at)
+        self._evicted(evicted)
+        return expires_at
+
+    def _set_shared(self, key: Hashable, value: Any, expires_at: float):
+        try:
+            self.shared.set(self.name, self._shared_key(key), value, expires_at)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.error(f"Error writing shared cache {self.name}: {e}")
+
+    def get_stale(self, key: Hashable) -> Any:
+        """The entry even if it expired less than stale_ttl ago; the shared tier is not consulted."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            if entry[0] + self.stale_ttl > time.time():
+                self.stale_hits += 1
+                return entry[1]
+            del self._data[key]
+        self._evicted([key])
+        return MISSING
+
+    def expire(self, key: Hashable):
+        """Make the entry a miss for get() but keep it for get_stale()."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data[key] = (min(entry[0], time.time()), entry[1])
+
+        if self.shared is not None:
+            try:
+                self.shared.delete(self.name, self._shared_key(key))
+            except sqlite3.Error as e:
+                logger.error(f"Error invalidating shared cache {self.name}: {e}")
+
+    def expire_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+        for key in keys:
+            self.expire(key)
+        return len(keys)
+
+    def _store(self, key: Hashable, value: Any, expires_at: float) -> List[Hashable]:
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        evicted = []
+        while len(self._data) > self.maxsize:
+            evicted.append(self._data.popitem(last=False)[0])
+        return evicted
+
+    def _evicted(self, keys: List[Hashable]):
+        if self.on_evict is not None:
+            for key in keys:
+                self.on_evict(key)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+        if self.shared is not None:
+            self._delete_shared(self._shared_key(key))
+
+    async def invalidate_async(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+        if self.shared is not None:
+            await asyncio.to_thread(self._delete_shared, self._shared_key(key))
+
+    def _delete_shared(self, shared_key: Optional[str] = None):
+        try:
+            self.shared.delete(self.name, shared_key)
+        except sqlite3.Error as e:
+            logger.error(f"Error invalidating shared cache {self.name}: {e}")
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+        for key in keys:
+            self.invalidate(key)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+        if self.shared is not None:
+            self._delete_shared()
+
+    async def clear_async(self):
+        with self._lock:
+            self._data.clear()
+        if self.shared is not None:
+            await asyncio.to_thread(self._delete_shared)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[0] > time.time()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        requests_total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "hit_ratio": self.hits / requests_total if requests_total else 0.0
+        }
+
+
+_shared_backend: Optional[SQLiteCacheBackend] = None
+
+
+def get_shared_backend(path: Optional[str]) -> Optional[SQLiteCacheBackend]:
+    global _shared_backend
+
+    if not path:
+        return None
+    if _shared_backend is None or _shared_backend.path != path:
+        _shared_backend = SQLiteCacheBackend(path)
+        logger.info(f"Shared cache backend initialized at {path}")
+    return _shared_backend
+
+
+def get_cache_stats() -> List[Dict[str, Any]]:
+    return [cache.stats() for cache in _caches]
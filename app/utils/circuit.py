@@ -0,0 +1,91 @@
+import time
+import logging
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+_breakers: List["CircuitBreaker"] = []
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open."""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"Circuit {name} is open, retry in {retry_in:.1f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Stops calling a dependency after consecutive failures and lets a single trial call through later.
+
+    closed: calls pass, failure_threshold failures in a row open the circuit.
+    open: calls fail at once with CircuitOpenError for recovery_timeout seconds.
+    half_open: one trial call passes; its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.opened = 0
+        self.rejected = 0
+        _breakers.append(self)
+
+    def before_call(self):
+        """Raise CircuitOpenError when the call must not be made; otherwise the caller reports the outcome."""
+        if self.state == STATE_CLOSED:
+            return
+
+        retry_in = self.opened_at + self.recovery_timeout - time.monotonic()
+        if self.state == STATE_OPEN and retry_in <= 0:
+            self.state = STATE_HALF_OPEN
+            logger.info(f"Circuit {self.name} half-open, sending a trial call")
+
+        if self.state == STATE_HALF_OPEN and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return
+
+        self.rejected += 1
+        raise CircuitOpenError(self.name, max(retry_in, 0.0))
+
+    def record_success(self):
+        self.trial_in_flight = False
+        self.failures = 0
+        if self.state != STATE_CLOSED:
+            logger.info(f"Circuit {self.name} closed")
+            self.state = STATE_CLOSED
+
+    def record_failure(self):
+        self.trial_in_flight = False
+        self.failures += 1
+        if self.state == STATE_HALF_OPEN or (self.state == STATE_CLOSED and self.failures >= self.failure_threshold):
+            self.state = STATE_OPEN
+            self.opened_at = time.monotonic()
+            self.opened += 1
+            logger.warning(f"Circuit {self.name} opened after {self.failures} failures")
+
+    def release(self):
+        # A trial call that was cancelled says nothing about the dependency
+        self.trial_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected
+        }
+
+
+def get_circuit_stats() -> List[Dict[str, Any]]:
+    return [breaker.stats() for breaker in _breakers]
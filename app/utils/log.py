@@ -0,0 +1,202 @@
+import os
+import re
+import sys
+import json
+import copy
+import queue
+import random
+import atexit
+import logging
+import contextvars
+import logging.handlers
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+# Fields such as update_id and user_id that are attached to every record logged inside a scope
+_log_context: contextvars.ContextVar = contextvars.ContextVar("log_context", default={})
+
+# Text typed by users is personal data, so it is only logged verbatim when LOG_USER_TEXT is enabled
+log_user_text = False
+
+REDACTION_PATTERNS = (
+    (re.compile(r"\b\d{6,12}:[A-Za-z0-9_-]{30,}\b"), "<bot-token>"),
+    (re.compile(r"(?i)(bearer\s+)[A-Za-z0-9._~+/=-]+"), r"\1<token>"),
+    (re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+"), "<email>"),
+    (re.compile(r"(?<!\w)\+?[78][\s(-]*\d{3}[\s)-]*\d{3}[\s-]*\d{2}[\s-]*\d{2}(?!\w)"), "<phone>")
+)
+
+log_stats = {
+    "sampled_out": 0,
+    "dropped": 0
+}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+@contextmanager
+def log_context(**fields):
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def current_log_context() -> Dict[str, Any]:
+    return dict(_log_context.get())
+
+
+def redact_text(text: Optional[str]) -> str:
+    if log_user_text:
+        return text or ""
+    return f"<{len(text or '')} chars>"
+
+
+def parse_sampling_rates(value: str) -> Dict[str, float]:
+    # "app.bot=0.1,TeleBot=0" -> {"app.bot": 0.1, "TeleBot": 0.0}
+    rates = {}
+    for item in value.split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class ContextFilter(logging.Filter):
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.context = _log_context.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of records below WARNING per logger; the longest matching logger prefix wins."""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def rate_for(self, name: str) -> float:
+        best, rate = -1, 1.0
+        for prefix, value in self.rates.items():
+            if (name == prefix or name.startswith(prefix + ".")) and len(prefix) > best:
+                best, rate = len(prefix), value
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self.rate_for(record.name)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        log_stats["sampled_out"] += 1
+        return False
+
+
+class RedactionFilter(logging.Filter):
+    """Masks credentials and contact details that end up in messages, e.g. through exception texts."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        for pattern, replacement in REDACTION_PATTERNS:
+            message = pattern.sub(replacement, message)
+        record.msg = message
+        record.args = None
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener thread; when the queue is full the record is dropped, never waited on."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_stats["dropped"] += 1
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        entry.update(getattr(record, "context", {}))
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+
+    def __init__(self):
+        super().__init__("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        line = super().formatMessage(record)
+        fields = {**getattr(record, "context", {}), **getattr(record, "fields", {})}
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+def setup_logging():
+    """Route every log record through a bounded queue to a background thread that formats and writes it.
+
+    LOG_FORMAT selects json or text output, LOG_LEVEL the root level, and LOG_SAMPLING the share
+    of DEBUG/INFO records kept per logger.
+    """
+    global _listener, log_user_text
+
+    if _listener is not None:
+        return
+
+    log_user_text = os.getenv("LOG_USER_TEXT", "false").lower() == "true"
+    formatter = JsonFormatter() if os.getenv("LOG_FORMAT", "json").lower() == "json" else TextFormatter()
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(formatter)
+
+    records = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    handler = NonBlockingQueueHandler(records)
+    handler.addFilter(ContextFilter())
+    handler.addFilter(SamplingFilter(parse_sampling_rates(os.getenv("LOG_SAMPLING", ""))))
+    handler.addFilter(RedactionFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+    # pyTelegramBotAPI attaches its own console handler; its records go through ours instead
+    telebot_logger = logging.getLogger("TeleBot")
+    for existing in list(telebot_logger.handlers):
+        telebot_logger.removeHandler(existing)
+
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush queued records; called on shutdown so the last lines are not lost."""
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,242 @@
+import os
+import sys
+import json
+import time
+import queue
+import random
+import atexit
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from app.utils.log import log_context
+
+logger = logging.getLogger(__name__)
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+SPAN_KIND_PRODUCER = 4
+SPAN_KIND_CONSUMER = 5
+
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class Span:
+    """A timed operation; exported in the shape of an OTLP/JSON span so standard tooling can read the files."""
+
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_span_id", "sampled", "attributes",
+                 "start_ns", "end_ns", "status", "status_message")
+
+    def __init__(self, name: str, kind: int, trace_id: str, parent_span_id: Optional[str], sampled: bool,
+                 attributes: Dict[str, Any]):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_span_id = parent_span_id
+        self.sampled = sampled
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.status = STATUS_OK
+        self.status_message = ""
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_otlp(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id or "",
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": self.status, "message": self.status_message}
+        }
+
+
+class RemoteParent:
+    """Span context received from elsewhere (a traceparent header or an outbox row)."""
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+
+def otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[RemoteParent]:
+    # W3C trace context: version-traceid-spanid-flags
+    parts = (value or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return RemoteParent(parts[1], parts[2], sampled)
+
+
+class SpanExporter:
+    """Writes finished spans as JSON lines from a background thread; a full queue drops spans."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.dropped = 0
+        self.exported = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=10000)
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            span = self._queue.get()
+            if span is None:
+                break
+            try:
+                self.stream.write(json.dumps(span.to_otlp(), ensure_ascii=False) + "\n")
+                if self._queue.empty():
+                    self.stream.flush()
+                self.exported += 1
+            except Exception as e:
+                logger.warning(f"Failed to export span: {e}")
+
+    def shutdown(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        self.stream.flush()
+
+
+_exporter: Optional[SpanExporter] = None
+_sample_ratio = 1.0
+
+
+def setup_tracing():
+    """TRACING_EXPORTER=console writes spans to stdout, file appends them to TRACING_FILE; none disables tracing."""
+    global _exporter, _sample_ratio
+
+    if _exporter is not None:
+        return
+
+    exporter = os.getenv("TRACING_EXPORTER", "none").lower()
+    _sample_ratio = float(os.getenv("TRACING_SAMPLE_RATIO", "1.0"))
+
+    if exporter == "console":
+        _exporter = SpanExporter(sys.stdout)
+    elif exporter == "file":
+        path = os.getenv("TRACING_FILE", "traces.jsonl")
+        _exporter = SpanExporter(open(path, "a", encoding="utf-8"))
+    elif exporter != "none":
+        raise ValueError(f"Unsupported TRACING_EXPORTER: {exporter}")
+    else:
+        return
+
+    atexit.register(stop_tracing)
+    logger.info(f"Tracing enabled ({exporter} exporter, sample ratio {_sample_ratio})")
+
+
+def stop_tracing():
+    global _exporter
+
+    if _exporter is not None:
+        _exporter.shutdown()
+        _exporter = None
+
+
+def is_tracing_enabled() -> bool:
+    return _exporter is not None
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_traceparent() -> Optional[str]:
+    span = _current_span.get()
+    return span.traceparent if span is not None else None
+
+
+def get_tracing_stats() -> Dict[str, Any]:
+    if _exporter is None:
+        return {"enabled": False}
+    return {"enabled": True, "exported": _exporter.exported, "dropped": _exporter.dropped}
+
+
+@contextmanager
+def start_span(name: str, kind: int = SPAN_KIND_INTERNAL, parent=None, activate: bool = True, **attributes):
+    """Run the block inside a child of the current span, or of parent; without either a new trace starts.
+
+    Yields the span, or None when tracing is disabled, so callers guard attribute updates. With
+    activate=False the span is not made current, which async generators need: they yield control
+    back to their consumer while the span is still open.
+    """
+    if _exporter is None:
+        yield None
+        return
+
+    parent = parent if parent is not None else _current_span.get()
+    if parent is None:
+        span = Span(name, kind, f"{random.getrandbits(128):032x}", None, random.random() < _sample_ratio, attributes)
+    else:
+        span = Span(name, kind, parent.trace_id, parent.span_id, parent.sampled, attributes)
+
+    token = _current_span.set(span) if activate else None
+    try:
+        if activate and (parent is None or isinstance(parent, RemoteParent)):
+            # Log records written inside a trace can be matched to its spans
+            with log_context(trace_id=span.trace_id):
+                yield span
+        else:
+            yield span
+    except BaseException as e:
+        span.record_error(e)
+        raise
+    finally:
+        if token is not None:
+            _current_span.reset(token)
+        span.end_ns = time.time_ns()
+        if span.sampled:
+            _exporter.export(span)
+
+
+@contextmanager
+def use_span(span):
+    """Make a span captured elsewhere current again, e.g. in a queue worker running a job later."""
+    token = _current_span.set(span)
+    try:
+        yield
+    finally:
+        _current_span.reset(token)
@@ -0,0 +1,270 @@
+"""Local stand-ins for the Telegram Bot API, Directus and the LLM RAG service.
+
+Each server is an aiohttp application with a configurable, seeded latency so a benchmark
+run exercises the bot's real network code without leaving the machine.
+"""
+import json
+import time
+import random
+import asyncio
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qsl
+
+from aiohttp import web
+
+
+class Latency:
+    """Delay of base seconds plus uniform jitter, drawn from its own seeded generator."""
+
+    def __init__(self, base: float, jitter: float, seed: int):
+        self.base = base
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+
+    async def wait(self):
+        delay = self.base + (self.rng.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def start_app(app: web.Application) -> web.AppRunner:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    app["base_url"] = f"http://127.0.0.1:{port}"
+    return runner
+
+
+class FakeTelegram:
+    """Serves getUpdates from an in-memory queue and reports every other Bot API call to a listener."""
+
+    def __init__(self, latency: Latency, on_call: Callable[[str, Dict[str, Any]], None]):
+        self.latency = latency
+        self.on_call = on_call
+        self.updates: List[Dict[str, Any]] = []
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.calls: Dict[str, int] = {}
+        self._new_updates = asyncio.Event()
+
+    def push_update(self, payload: Dict[str, Any]) -> int:
+        update_id = self.next_update_id
+        self.next_update_id += 1
+        self.updates.append({"update_id": update_id, **payload})
+        self._new_updates.set()
+        return update_id
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(request.query)
+        if request.method == "POST":
+            params.update(await request.post())
+        elif request.can_read_body:
+            # telebot sends getUpdates as a GET with a form-encoded body, which request.post() ignores
+            params.update(parse_qsl((await request.read()).decode("utf-8")))
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+        if method == "getUpdates":
+            return web.json_response({"ok": True, "result": await self.get_updates(params)})
+
+        await self.latency.wait()
+        self.on_call(method, params)
+        return web.json_response({"ok": True, "result": self.result_for(method, params)})
+
+    async def get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+
+        # Updates below the offset have been confirmed by the bot
+        self.updates = [update for update in self.updates if update["update_id"] >= offset]
+        if not self.updates and timeout > 0:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:limit]
+
+    def result_for(self, method: str, params: Dict[str, Any]) -> Any:
+        if method in ("sendMessage", "editMessageText", "sendPhoto"):
+            chat_id = int(params.get("chat_id", 0))
+            message_id = int(params.get("message_id") or 0) or self.next_message_id
+            self.next_message_id += 1
+            message = {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", "")
+            }
+            if method == "sendPhoto":
+                message["photo"] = [{"file_id": "bench-photo", "file_unique_id": "bench", "width": 1, "height": 1}]
+            return message
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        return True
+
+
+class FakeDirectus:
+    """Read-only Directus items API over a generated dataset.
+
+    Supports the subset the bot uses: /items/<collection>, /items/<collection>/<id> and
+    /users/<id>, JSON filters with _eq/_in, comma-separated fields with dotted relations,
+    limit and a single-field sort.
+    """
+
+    def __init__(self, data: Dict[str, Dict[Any, Dict[str, Any]]], relations: Dict[str, Dict[str, str]],
+                 latency: Latency):
+        self.data = data
+        self.relations = relations
+        self.latency = latency
+        self.requests: Dict[str, int] = {}
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/items/{collection}", self.list_items)
+        app.router.add_get("/items/{collection}/{id}", self.get_item)
+        app.router.add_get("/users/{id}", self.get_user)
+        return app
+
+    def count(self, collection: str):
+        self.requests[collection] = self.requests.get(collection, 0) + 1
+
+    async def list_items(self, request: web.Request) -> web.Response:
+        collection = request.match_info["collection"]
+        self.count(collection)
+        await self.latency.wait()
+
+        records = list(self.data.get(collection, {}).values())
+        directus_filter = json.loads(request.query.get("filter", "{}") or "{}")
+        records = [record for record in records if self.matches(collection, record, directus_filter)]
+
+        sort = request.query.get("sort", "")
+        if sort:
+            field = sort.split(",")[0]
+            records.sort(key=lambda record: str(record.get(field.lstrip("-"), "")), reverse=field.startswith("-"))
+
+        limit = int(request.query.get("limit", "100"))
+        if limit >= 0:
+            records = records[:limit]
+
+        fields = self.parse_fields(request)
+        return web.json_response({"data": [self.select(collection, record, fields) for record in records]})
+
+    async def get_item(self, request: web.Request) -> web.Response:
+        collection = request.match_info["collection"]
+        self.count(collection)
+        await self.latency.wait()
+        return self.single(collection, request.match_info["id"], request)
+
+    async def get_user(self, request: web.Request) -> web.Response:
+        self.count("users")
+        await self.latency.wait()
+        return self.single("users", request.match_info["id"], request)
+
+    def single(self, collection: str, item_id: str, request: web.Request) -> web.Response:
+        record = self.lookup(collection, item_id)
+        if record is None:
+            return web.json_response({"errors": [{"message": "Forbidden"}]}, status=403)
+        return web.json_response({"data": self.select(collection, record, self.parse_fields(request))})
+
+    def lookup(self, collection: str, item_id: Any) -> Optional[Dict[str, Any]]:
+        records = self.data.get(collection, {})
+        return records.get(item_id) or records.get(str(item_id)) or records.get(
+            int(item_id) if str(item_id).isdigit() else None
+        )
+
+    @staticmethod
+    def parse_fields(request: web.Request) -> List[str]:
+        value = request.query.get("fields", "*")
+        return [field for field in value.split(",") if field] or ["*"]
+
+    def matches(self, collection: str, record: Dict[str, Any], directus_filter: Dict[str, Any]) -> bool:
+        for field, condition in directus_filter.items():
+            if field == "_and":
+                if not all(self.matches(collection, record, part) for part in condition):
+                    return False
+                continue
+            value = record.get(field)
+            for operator, expected in condition.items():
+                if isinstance(expected, dict):
+                    # Filter on a related record's field, e.g. {"user_id": {"status": {"_eq": ...}}}
+                    related = self.lookup(self.relations.get(collection, {}).get(field, ""), value)
+                    if related is None or not self.matches("", related, {operator: expected}):
+                        return False
+                elif operator == "_eq" and str(value) != str(expected):
+                    return False
+                elif operator == "_in":
+                    candidates = expected.split(",") if isinstance(expected, str) else expected
+                    if str(value) not in {str(candidate) for candidate in candidates}:
+                        return False
+        return True
+
+    def select(self, collection: str, record: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+        for field in fields:
+            head, _, rest = field.partition(".")
+            if head == "*":
+                for key, value in record.items():
+                    result.setdefault(key, value)
+                continue
+            if head not in record:
+                continue
+            if not rest:
+                if not isinstance(result.get(head), dict):
+                    result[head] = record[head]
+                continue
+
+            target = self.relations.get(collection, {}).get(head)
+            related = self.lookup(target, record[head]) if target else None
+            if related is None:
+                result[head] = None
+                continue
+            nested = result.get(head) if isinstance(result.get(head), dict) else {}
+            nested.update(self.select(target, related, [rest]))
+            result[head] = nested
+        return result
+
+
+class FakeRag:
+    """POST /ask answering after a seeded delay, as JSON or as server-sent events when asked to stream."""
+
+    def __init__(self, latency: Latency, chunks: int = 8):
+        self.latency = latency
+        self.chunks = chunks
+        self.requests = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/ask", self.ask)
+        return app
+
+    async def ask(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        self.requests += 1
+        answer = f"Ответ на вопрос: {payload.get('question', '')}"
+
+        if not payload.get("stream"):
+            await self.latency.wait()
+            return web.json_response({"answer": answer})
+
+        # The first token takes the configured latency, the rest of the answer trickles in after it
+        await self.latency.wait()
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        words = answer.split(" ")
+        step = max(1, len(words) // self.chunks)
+        for start in range(0, len(words), step):
+            await asyncio.sleep(self.latency.base / self.chunks)
+            piece = " ".join(words[start:start + step]) + " "
+            await response.write(f"data: {json.dumps({'token': piece}, ensure_ascii=False)}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
@@ -0,0 +1,205 @@
+"""Replay synthetic user traffic against the bot and report latency percentiles and throughput.
+
+Usage, from the repository root:
+
+    python -m benchmarks.run --users 50 --sessions 3 --seed 1 --output results.json
+    python -m benchmarks.run --users 50 --sessions 3 --seed 1 --compare results.json
+
+The bot runs in this process with its real handlers, executor, queues and HTTP clients;
+Telegram, Directus and the RAG service are local stand-ins with seeded latencies. Latency
+is measured from the moment an update becomes available to getUpdates until the Bot API
+call that completes it (the reply, or the final edit of a Нейровопрос answer).
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import statistics
+from typing import Any, Dict, List, Optional
+
+from benchmarks.fake_servers import FakeDirectus, FakeRag, FakeTelegram, Latency, start_app
+from benchmarks.workload import RELATIONS, USER_ID_BASE, build_dataset, build_session, chat_of
+
+
+def percentile(values: List[float], share: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(share * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0
+    }
+
+
+class Harness:
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.pending: Dict[int, Dict[str, Any]] = {}
+        self.latencies: Dict[str, List[float]] = {}
+        self.timeouts = 0
+
+        self.telegram = FakeTelegram(Latency(args.telegram_latency, args.telegram_latency / 2, args.seed + 1),
+                                     self.on_bot_call)
+        self.directus = FakeDirectus(build_dataset(args.users, args.seed), RELATIONS,
+                                     Latency(args.directus_latency, args.directus_latency / 2, args.seed + 2))
+        self.rag = FakeRag(Latency(args.rag_latency, args.rag_jitter, args.seed + 3))
+
+    def on_bot_call(self, method: str, params: Dict[str, Any]):
+        chat_id = chat_of(method, params)
+        step = self.pending.get(chat_id)
+        if step is not None and step["expectation"](method, params):
+            del self.pending[chat_id]
+            step["done"].set_result(time.perf_counter())
+
+    async def run_user(self, index: int):
+        rng = random.Random(self.args.seed * 100003 + index)
+        telegram_id = USER_ID_BASE + index
+
+        for _ in range(self.args.sessions):
+            for kind, payload, expectation in build_session(rng, telegram_id, self.args.questions):
+                done = asyncio.get_running_loop().create_future()
+                self.pending[telegram_id] = {"expectation": expectation, "done": done}
+                started = time.perf_counter()
+                self.telegram.push_update(payload)
+                try:
+                    finished = await asyncio.wait_for(done, timeout=self.args.step_timeout)
+                    self.latencies.setdefault(kind, []).append(finished - started)
+                except asyncio.TimeoutError:
+                    self.pending.pop(telegram_id, None)
+                    self.timeouts += 1
+                if self.args.think_time:
+                    await asyncio.sleep(rng.expovariate(1 / self.args.think_time))
+
+    async def run(self) -> Dict[str, Any]:
+        runners = [await start_app(app) for app in (self.telegram.app(), self.directus.app(), self.rag.app())]
+        telegram_url, directus_url, rag_url = (runner.app["base_url"] for runner in runners)
+
+        # Configuration is read at import time, so the environment is set before the bot is imported
+        workdir = tempfile.mkdtemp(prefix="bot-bench-")
+        os.environ.update({
+            "TELEGRAM_BOT_TOKEN": "123456:benchmark",
+            "TELEGRAM_API_URL": telegram_url,
+            "DIRECTUS_URL": directus_url,
+            "DIRECTUS_TOKEN": "benchmark",
+            "LLM_RAG_API_URL": rag_url,
+            "LLM_RAG_STREAMING": "true" if self.args.streaming else "false",
+            "NOTIFICATION_OUTBOX_PATH": os.path.join(workdir, "outbox.db"),
+            "CONVERSATION_STORE": "memory"
+        })
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+        from app.utils.log import setup_logging, stop_logging
+        setup_logging()
+        from app.bot.bot import setup_bot, update_executor, llm_queue
+        from app.services.directus import close_directus_client
+        from app.services.llm_rag import close_llm_rag_session
+
+        bot = setup_bot()
+        update_executor.start()
+        llm_queue.start()
+        polling = asyncio.create_task(bot.polling(non_stop=True, timeout=1, request_timeout=10))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(self.run_user(index) for index in range(self.args.users)))
+        elapsed = time.perf_counter() - started
+
+        polling.cancel()
+        await asyncio.gather(polling, return_exceptions=True)
+        await update_executor.stop()
+        await llm_queue.stop()
+        await bot.close_session()
+        await close_directus_client()
+        await close_llm_rag_session()
+        for runner in runners:
+            await runner.cleanup()
+        stop_logging()
+
+        everything = [value for values in self.latencies.values() for value in values]
+        return {
+            "config": {key: value for key, value in vars(self.args).items() if key not in ("output", "compare")},
+            "elapsed_s": round(elapsed, 3),
+            "updates": len(everything),
+            "timeouts": self.timeouts,
+            "updates_per_s": round(len(everything) / elapsed, 2) if elapsed else 0.0,
+            "overall": summarize(everything),
+            "by_kind": {kind: summarize(values) for kind, values in sorted(self.latencies.items())},
+            "upstream_requests": {
+                "directus": dict(sorted(self.directus.requests.items())),
+                "rag": self.rag.requests,
+                "telegram": dict(sorted(self.telegram.calls.items()))
+            }
+        }
+
+
+def print_report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    def delta(current: float, previous: Optional[float]) -> str:
+        if not previous:
+            return ""
+        return f" ({(current - previous) / previous * 100:+.1f}%)"
+
+    base_kinds = (baseline or {}).get("by_kind", {})
+    print(f"updates: {result['updates']}  timeouts: {result['timeouts']}  elapsed: {result['elapsed_s']}s")
+    print(f"throughput: {result['updates_per_s']} updates/s"
+          f"{delta(result['updates_per_s'], (baseline or {}).get('updates_per_s'))}")
+    print(f"{'kind':<20}{'count':>7}{'p50 ms':>22}{'p95 ms':>22}{'p99 ms':>22}")
+    rows = [("overall", result["overall"], (baseline or {}).get("overall", {}))]
+    rows += [(kind, stats, base_kinds.get(kind, {})) for kind, stats in result["by_kind"].items()]
+    for kind, stats, base in rows:
+        cells = "".join(
+            f"{str(stats[key]) + delta(stats[key], base.get(key)):>22}" for key in ("p50_ms", "p95_ms", "p99_ms")
+        )
+        print(f"{kind:<20}{stats['count']:>7}{cells}")
+    print(f"directus requests: {sum(result['upstream_requests']['directus'].values())}"
+          f"  rag requests: {result['upstream_requests']['rag']}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline load test of the Telegram bot")
+    parser.add_argument("--users", type=int, default=50, help="concurrent simulated users")
+    parser.add_argument("--sessions", type=int, default=3, help="sessions each user goes through")
+    parser.add_argument("--questions", type=int, default=2, help="Нейровопрос questions per session")
+    parser.add_argument("--seed", type=int, default=1, help="seed for data, traffic and upstream latencies")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between a user's steps, s")
+    parser.add_argument("--telegram-latency", type=float, default=0.02, help="Bot API latency, s")
+    parser.add_argument("--directus-latency", type=float, default=0.02, help="Directus latency, s")
+    parser.add_argument("--rag-latency", type=float, default=0.5, help="RAG answer latency, s")
+    parser.add_argument("--rag-jitter", type=float, default=0.2, help="RAG latency jitter, s")
+    parser.add_argument("--streaming", action="store_true", help="ask the RAG service for streamed answers")
+    parser.add_argument("--step-timeout", type=float, default=60.0, help="give up on an update after, s")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    random.seed(args.seed)
+    result = asyncio.run(Harness(args).run())
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+    print_report(result, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(result, output_file, ensure_ascii=False, indent=2)
+    return 1 if result["timeouts"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
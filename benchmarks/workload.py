@@ -0,0 +1,211 @@
+"""Seeded synthetic data for the fake Directus and scripted user sessions for the fake Telegram."""
+import random
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Telegram ids of benchmark users start here so they never collide with small ids used by the bot
+USER_ID_BASE = 100000
+
+RELATIONS = {
+    "student_accommodation": {"type": "student_accommodation_type"},
+    "student_accommodation_floors": {
+        "accommodation_id": "student_accommodation",
+        "accommodation_address": "student_accommodation_addresses"
+    },
+    "student_accommodation_apartments_blocks": {"floor_id": "student_accommodation_floors"},
+    "student_accommodation_rooms": {
+        "floor_id": "student_accommodation_floors",
+        "apartments_blocks_id": "student_accommodation_apartments_blocks"
+    },
+    "student_accommodation_room_occupations": {"room_id": "student_accommodation_rooms"},
+    "student_relocation_applications": {
+        "student_relocation_id": "student_relocation",
+        "student_accommodation_id_from": "student_accommodation",
+        "student_accommodation_from_address_id": "student_accommodation_addresses",
+        "user_created": "users"
+    },
+    "student_relocation_applications_match": {
+        "relocation_applications_id_from": "student_relocation_applications",
+        "relocation_applications_id_to": "student_relocation_applications"
+    }
+}
+
+QUESTIONS = [
+    "Какие документы нужны для заселения?",
+    "Можно ли заселиться раньше срока?",
+    "Сколько стоит проживание в общежитии?",
+    "Как оплатить проживание?",
+    "Можно ли жить вдвоём с другом?",
+    "Как подать заявку на переселение?",
+    "Что делать, если сломалась мебель?",
+    "Когда можно въехать после каникул?",
+    "Нужна ли флюорография для заселения?",
+    "Можно ли готовить в комнате?",
+    "Как получить пропуск в общежитие?",
+    "Где узнать номер своей комнаты?"
+]
+
+
+def build_dataset(users: int, seed: int) -> Dict[str, Dict[Any, Dict[str, Any]]]:
+    """Accommodation reference data plus links, occupations and relocation applications per user."""
+    rng = random.Random(seed)
+    data: Dict[str, Dict[Any, Dict[str, Any]]] = {name: {} for name in (
+        "student_accommodation", "student_accommodation_type", "student_accommodation_addresses",
+        "student_accommodation_floors", "student_accommodation_apartments_blocks", "student_accommodation_rooms",
+        "student_accommodation_room_occupations", "telegram_user_links", "users", "student_relocation",
+        "student_relocation_applications", "student_relocation_applications_match", "bus_schedule"
+    )}
+
+    data["student_accommodation_type"][1] = {"id": 1, "name": "Общежитие"}
+    data["student_accommodation_type"][2] = {"id": 2, "name": "Дом студента"}
+    for index in range(1, 6):
+        data["student_accommodation"][index] = {"id": index, "name": f"Общежитие №{index}", "type": 1 + index % 2}
+        data["student_accommodation_addresses"][index] = {
+            "id": index, "city": "Москва", "street": f"ул. Студенческая", "building_number": str(index),
+            "house_structure": "", "corpus": str(index % 3 or "")
+        }
+
+    room_id = 0
+    for accommodation in range(1, 6):
+        for floor in range(5):
+            floor_id = accommodation * 100 + floor
+            data["student_accommodation_floors"][floor_id] = {
+                "id": floor_id, "floor_number": floor, "accommodation_id": accommodation,
+                "accommodation_address": accommodation
+            }
+            block_id = floor_id * 10
+            data["student_accommodation_apartments_blocks"][block_id] = {
+                "id": block_id, "number": f"{floor + 1}0{accommodation}", "floor_id": floor_id
+            }
+            for _ in range(10):
+                room_id += 1
+                data["student_accommodation_rooms"][room_id] = {
+                    "id": room_id, "room_number": str(room_id), "max_capacity": rng.choice((2, 3, 4)),
+                    "floor_id": floor_id, "apartments_blocks_id": block_id if rng.random() < 0.5 else None
+                }
+
+    data["student_relocation"][1] = {"id": 1, "name": "<p>Весеннее переселение</p>"}
+    data["bus_schedule"][1] = {
+        "id": 1, "date_created": "2024-09-01T00:00:00", "image": "bench-image", "description": "Расписание"
+    }
+
+    application_id = 0
+    for index in range(users):
+        telegram_id = USER_ID_BASE + index
+        system_id = f"user-{index}"
+        # A few accounts are not linked, which the bot answers without further Directus calls
+        if rng.random() < 0.1:
+            continue
+        data["telegram_user_links"][telegram_id] = {"id": telegram_id, "telegram_id": telegram_id, "user_id": system_id}
+        data["users"][system_id] = {"id": system_id, "first_name": "Студент", "last_name": str(index)}
+
+        if rng.random() < 0.85:
+            data["student_accommodation_room_occupations"][index + 1] = {
+                "id": index + 1, "user_id": system_id, "room_id": rng.randint(1, room_id)
+            }
+
+        if rng.random() < 0.6:
+            application_id += 1
+            data["student_relocation_applications"][application_id] = {
+                "id": application_id,
+                "status": rng.choice(("created", "rejected", "ended", "ended")),
+                "student_relocation_id": 1,
+                "student_accommodation_id_from": rng.randint(1, 5),
+                "student_accommodation_from_address_id": rng.randint(1, 5),
+                "room_number": str(rng.randint(1, room_id)),
+                "apartment_number": None,
+                "floor": rng.randint(1, 5),
+                "user_created": system_id,
+                "date_created": f"2024-03-{rng.randint(1, 28):02d}T00:00:00"
+            }
+
+    application_ids = list(data["student_relocation_applications"])
+    for match_id, target in enumerate(application_ids, start=1):
+        source = rng.choice(application_ids)
+        data["student_relocation_applications_match"][match_id] = {
+            "id": match_id,
+            "status": "approved" if rng.random() < 0.7 else "pending",
+            "relocation_applications_id_to": target,
+            "relocation_applications_id_from": source
+        }
+
+    return data
+
+
+Expectation = Callable[[str, Dict[str, Any]], bool]
+
+
+def sent_message(method: str, params: Dict[str, Any]) -> bool:
+    return method == "sendMessage"
+
+
+def sent_schedule(method: str, params: Dict[str, Any]) -> bool:
+    return method in ("sendPhoto", "sendMessage")
+
+
+def edited_message(method: str, params: Dict[str, Any]) -> bool:
+    return method in ("editMessageText", "sendMessage")
+
+
+def answered_question(method: str, params: Dict[str, Any]) -> bool:
+    # The final answer (or a refusal) carries the "end conversation" button; the placeholder does not
+    return method in ("editMessageText", "sendMessage") and "end_conversation" in params.get("reply_markup", "")
+
+
+def ended_conversation(method: str, params: Dict[str, Any]) -> bool:
+    return method == "sendMessage" and "keyboard" in params.get("reply_markup", "")
+
+
+# (kind, update payload, check that a Bot API call completes the update)
+Step = Tuple[str, Dict[str, Any], Expectation]
+
+
+def message_update(telegram_id: int, text: str, message_id: int) -> Dict[str, Any]:
+    return {"message": {
+        "message_id": message_id,
+        "date": 0,
+        "chat": {"id": telegram_id, "type": "private"},
+        "from": {"id": telegram_id, "is_bot": False, "first_name": "Bench"},
+        "text": text
+    }}
+
+
+def callback_update(telegram_id: int, data: str, message_id: int) -> Dict[str, Any]:
+    return {"callback_query": {
+        "id": f"{telegram_id}-{message_id}",
+        "chat_instance": str(telegram_id),
+        "from": {"id": telegram_id, "is_bot": False, "first_name": "Bench"},
+        "data": data,
+        "message": {
+            "message_id": message_id,
+            "date": 0,
+            "chat": {"id": telegram_id, "type": "private"},
+            "text": "Нажмите 'Начать', чтобы начать разговор."
+        }
+    }}
+
+
+def build_session(rng: random.Random, telegram_id: int, questions: int) -> List[Step]:
+    """One user visit: a few status buttons in random order, then a Нейровопрос conversation."""
+    steps: List[Step] = []
+    message_id = rng.randint(1, 10 ** 6)
+
+    buttons = [("checkin", "Заселение", sent_message), ("relocation", "Переселение", sent_message),
+               ("bus_schedule", "Расписание автобусов", sent_schedule)]
+    for kind, text, expectation in rng.sample(buttons, rng.randint(1, len(buttons))):
+        steps.append((kind, message_update(telegram_id, text, message_id), expectation))
+
+    if questions:
+        steps.append(("neural_menu", message_update(telegram_id, "Нейровопрос", message_id), sent_message))
+        steps.append(("start_conversation", callback_update(telegram_id, "start_conversation", message_id),
+                      edited_message))
+        for _ in range(questions):
+            steps.append(("question", message_update(telegram_id, rng.choice(QUESTIONS), message_id),
+                          answered_question))
+        steps.append(("end_conversation", callback_update(telegram_id, "end_conversation", message_id),
+                      ended_conversation))
+    return steps
+
+
+def chat_of(method: str, params: Dict[str, Any]) -> Optional[int]:
+    chat_id = params.get("chat_id")
+    return int(chat_id) if chat_id not in (None, "") else None
@@ -1,24 +1,24 @@
 import os
 import logging
-import threading
 import asyncio
 from dotenv import load_dotenv
 from fastapi import FastAPI
-from app.bot.bot import setup_bot
+from app.bot.bot import setup_bot, get_update_mode, setup_webhook, run_polling, update_executor, llm_queue
 from app.api.routes import setup_routes
+from app.bot.notifications import run_outbox_sender
+from app.services.directus import close_directus_client, warm_up_caches
+from app.services.llm_rag import close_llm_rag_session
+from app.utils.log import setup_logging, stop_logging
+from app.utils.tracing import setup_tracing, stop_tracing
 
 
+load_dotenv()
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+setup_logging()
+setup_tracing()
 logger = logging.getLogger(__name__)
 
 
-load_dotenv()
-
-
 app = FastAPI(title="Telegram Bot API",
               docs_url="/docs")
 
@@ -26,22 +26,58 @@ app = FastAPI(title="Telegram Bot API",
 bot = setup_bot()
 setup_routes(app, bot)
 
+polling_task = None
+outbox_task = None
+
+CACHE_WARMUP = os.getenv("CACHE_WARMUP", "true").lower() == "true"
+CACHE_WARMUP_TIMEOUT = float(os.getenv("CACHE_WARMUP_TIMEOUT", "15"))
+
 @app.on_event("startup")
 async def startup_event():
+    global polling_task, outbox_task
+
+    if CACHE_WARMUP:
+        # Updates are only taken once the caches are warm; a slow or failing Directus must not block startup
+        try:
+            await asyncio.wait_for(warm_up_caches(), timeout=CACHE_WARMUP_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Cache warm-up did not finish in {CACHE_WARMUP_TIMEOUT:.0f}s, starting with partly cold caches")
+
     logger.info("Starting Telegram bot...")
     try:
+        update_executor.start()
+        llm_queue.start()
+        outbox_task = asyncio.create_task(run_outbox_sender(bot))
 
-        def run_bot():
-            bot.infinity_polling()
-
-        threading.Thread(target=run_bot, daemon=True).start()
+        if get_update_mode() == "webhook":
+            # Updates arrive through /telegram/webhook; see the README before running several workers
+            await setup_webhook(bot)
+        else:
+            # Runs in the background, so the notification API is served even while Telegram is unreachable
+            polling_task = asyncio.create_task(run_polling(bot))
         logger.info("Telegram bot started successfully!")
     except Exception as e:
         logger.error(f"Failed to start Telegram bot: {e}")
         raise
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    logger.info("Stopping Telegram bot...")
+    if polling_task is not None:
+        polling_task.cancel()
+    if outbox_task is not None:
+        outbox_task.cancel()
+    await update_executor.stop()
+    await llm_queue.stop()
+    await bot.close_session()
+    await close_directus_client()
+    await close_llm_rag_session()
+    stop_tracing()
+    stop_logging()
+
+
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run("main:app", host="0.0.0.0", port=8300, reload=False)
\ No newline at end of file
+    uvicorn.run("main:app", host="0.0.0.0", port=8300, reload=False)
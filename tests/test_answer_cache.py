@@ -0,0 +1,42 @@
+import pytest
+
+from app.services import llm_rag
+from app.services.llm_rag import AnswerCache, normalize_question, question_vector, cosine_similarity
+
+DIRECTORY = "instruction_documents"
+
+
+def similarity(a: str, b: str) -> float:
+    return cosine_similarity(question_vector(normalize_question(a)), question_vector(normalize_question(b)))
+
+
+def test_similarity_lookup_is_off_by_default():
+    assert llm_rag.answer_cache.similarity_threshold == 0
+
+    cache = AnswerCache()
+    cache.set(DIRECTORY, "Какие документы нужны для заселения?", "Паспорт")
+    assert cache.get(DIRECTORY, "какие документы нужны для заселения") == "Паспорт"
+    assert cache.get(DIRECTORY, "Какие документы нужны для заселениия?") is None
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("Какие документы нужны для заселения?", "Какие документы не нужны для заселения?"),
+    ("Как добраться до общежития №1?", "Как добраться до общежития №2?"),
+    ("Как добраться до общежитие 5?", "Как добраться до общежитие 3?"),
+    ("Расписание заселения на 2024 год", "Расписание заселения на 2025 год"),
+])
+def test_similar_questions_with_other_numbers_or_negations_miss(cached, asked):
+    # Close enough by trigrams to pass the threshold on their own
+    assert similarity(cached, asked) >= 0.9
+
+    cache = AnswerCache(similarity_threshold=0.9)
+    cache.set(DIRECTORY, cached, "ответ")
+    assert cache.get(DIRECTORY, asked) is None
+    assert cache.similar_hits == 0
+
+
+def test_similar_question_with_a_typo_hits():
+    cache = AnswerCache(similarity_threshold=0.9)
+    cache.set(DIRECTORY, "Какие документы нужны для заселения в общежитие №1?", "Паспорт")
+    assert cache.get(DIRECTORY, "Какие документы нужны для заселениия в общежитие 1") == "Паспорт"
+    assert cache.similar_hits == 1
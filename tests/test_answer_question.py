@@ -0,0 +1,80 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.bot import bot as bot_module
+from app.bot.bot import answer_question, split_message, TELEGRAM_MESSAGE_LIMIT
+
+
+class FakeBot:
+    """Records what the handler sends; edits or sends fail when told to."""
+
+    def __init__(self, fail_edit=False, fail_send=False):
+        self.fail_edit = fail_edit
+        self.fail_send = fail_send
+        self.edits = []
+        self.sent = []
+
+    async def send_chat_action(self, chat_id, action):
+        pass
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, reply_markup=None):
+        if self.fail_edit or len(text) > TELEGRAM_MESSAGE_LIMIT:
+            raise RuntimeError("Bad Request: message is too long")
+        self.edits.append((text, reply_markup))
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        if self.fail_send or len(text) > TELEGRAM_MESSAGE_LIMIT:
+            raise RuntimeError("Bad Request: message is too long")
+        self.sent.append((text, reply_markup))
+
+
+def ask(monkeypatch, bot, answer):
+    async def ask_llm_rag(question, context=None):
+        return {"answer": answer}
+
+    monkeypatch.setattr(bot_module, "ask_llm_rag", ask_llm_rag)
+    monkeypatch.setattr(bot_module, "is_streaming_enabled", lambda: False)
+    asyncio.run(answer_question(bot, 1, "вопрос", SimpleNamespace(message_id=10)))
+
+
+def test_split_message_prefers_line_breaks():
+    text = "\n".join(["а" * 3000, "б" * 3000, "в" * 100])
+    parts = split_message(text)
+    assert parts == ["а" * 3000, "б" * 3000 + "\n" + "в" * 100]
+    assert split_message("г" * 5000) == ["г" * 4096, "г" * 904]
+    assert split_message("") == [""]
+
+
+def test_long_answer_is_sent_in_parts_with_the_keyboard_last(monkeypatch):
+    bot = FakeBot()
+    ask(monkeypatch, bot, "слово " * 700)
+
+    assert len(bot.edits) == 1 and bot.edits[0][1] is None
+    assert len(bot.sent) == 1 and bot.sent[0][1] is not None
+    assert "".join(text for text, _ in bot.edits + bot.sent).replace(" ", "") == "слово" * 700
+
+
+def test_failed_fallback_send_does_not_escape(monkeypatch):
+    bot = FakeBot(fail_edit=True, fail_send=True)
+    ask(monkeypatch, bot, "ответ")
+    assert bot.edits == [] and bot.sent == []
+
+
+def test_failed_stream_is_neither_shown_nor_remembered_as_an_answer(monkeypatch):
+    async def stream_llm_rag(question, context=None):
+        yield "Половина ответа"
+        raise bot_module.LLMStreamError(bot_module.extract_answer({"error": "down", "detail": "Сервер недоступен"}))
+
+    remembered = []
+
+    async def remember_turn(user_id, question, answer):
+        remembered.append(answer)
+
+    monkeypatch.setattr(bot_module, "stream_llm_rag", stream_llm_rag)
+    monkeypatch.setattr(bot_module, "is_streaming_enabled", lambda: True)
+    monkeypatch.setattr(bot_module, "remember_turn", remember_turn)
+    bot = FakeBot()
+    asyncio.run(answer_question(bot, 1, "вопрос", SimpleNamespace(message_id=10), user_id=5))
+
+    assert bot.edits[-1][0] == "Сервер недоступен"
+    assert remembered == []
@@ -0,0 +1,67 @@
+import asyncio
+import threading
+
+from app.utils.cache import TTLCache, SQLiteCacheBackend, MISSING
+
+
+class RecordingBackend(SQLiteCacheBackend):
+    """Notes the thread of every query made to the shared tier."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.threads = []
+
+    def get(self, namespace, key):
+        self.threads.append(threading.get_ident())
+        return super().get(namespace, key)
+
+    def set(self, namespace, key, value, expires_at):
+        self.threads.append(threading.get_ident())
+        super().set(namespace, key, value, expires_at)
+
+    def delete(self, namespace, key=None):
+        self.threads.append(threading.get_ident())
+        super().delete(namespace, key)
+
+
+def test_shared_tier_is_used_off_the_event_loop(tmp_path):
+    backend = RecordingBackend(str(tmp_path / "cache.sqlite3"))
+    writer = TTLCache("reference_test", shared=backend)
+    # Another replica on the same host, with a cold in-process tier
+    reader = TTLCache("reference_test", shared=backend)
+
+    async def scenario():
+        await writer.set_async(("student_accommodation", "1"), {"name": "Общежитие №1"})
+        shared_hit = await reader.get_async(("student_accommodation", "1"))
+        await writer.invalidate_async(("student_accommodation", "1"))
+        await writer.clear_async()
+        return threading.get_ident(), shared_hit, await TTLCache("reference_test", shared=backend).get_async(
+            ("student_accommodation", "1")
+        )
+
+    loop_thread, shared_hit, after_invalidation = asyncio.run(scenario())
+    assert shared_hit == {"name": "Общежитие №1"}
+    assert after_invalidation is MISSING
+    assert reader.stats()["hits"] == 1
+    # Served from the in-process tier now, without touching SQLite
+    assert reader.get(("student_accommodation", "1")) == {"name": "Общежитие №1"}
+    assert len(backend.threads) == 5
+    assert loop_thread not in backend.threads
+
+
+def test_on_evict_reports_entries_the_cache_drops_itself():
+    evicted = []
+    cache = TTLCache("evict_test", maxsize=2, ttl=60, on_evict=evicted.append)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("c", 3)
+    assert evicted == ["a"]
+
+    cache.set("d", 4, ttl=-1)
+    assert evicted == ["a", "b"]
+    # Past its TTL with no stale window, so it goes on the next lookup
+    assert cache.get("d") is MISSING
+    assert evicted == ["a", "b", "d"]
+
+    cache.invalidate("c")
+    assert evicted == ["a", "b", "d"]
@@ -0,0 +1,63 @@
+import asyncio
+
+from app.services import webapp
+from app.services.status_snapshots import status_snapshots
+
+OCCUPATION = {
+    "id": 11,
+    "room_id": {
+        "room_number": "305",
+        "max_capacity": 3,
+        "floor_id": None,
+        "apartments_blocks_id": {
+            "number": "3А",
+            "floor_id": {
+                "floor_number": 2,
+                "accommodation_id": {"name": "Общежитие №4", "type": {"name": "Коридорный"}},
+                "accommodation_address": {"city": "Москва", "street": "ул. Студенческая", "building_number": "12"}
+            }
+        }
+    }
+}
+
+
+class StubDirectus:
+    """Stands in for make_directus_request and records every request made."""
+
+    def __init__(self):
+        self.requests = []
+
+    async def __call__(self, endpoint, method="GET", params=None):
+        self.requests.append((endpoint, params))
+        if endpoint == "/items/telegram_user_links":
+            return {"data": [{"user_id": "user-42"}]}
+        if endpoint == "/items/student_accommodation_room_occupations":
+            return {"data": [OCCUPATION]}
+        raise AssertionError(f"Unexpected Directus request to {endpoint}")
+
+
+def test_checkin_status_takes_two_requests_and_none_when_repeated(monkeypatch):
+    directus = StubDirectus()
+    monkeypatch.setattr(webapp, "make_directus_request", directus)
+
+    message = asyncio.run(webapp.check_checkin_status(2001))
+    # The link, then the whole room -> block -> floor -> accommodation/type/address tree in one query
+    assert [endpoint for endpoint, _ in directus.requests] == [
+        "/items/telegram_user_links", "/items/student_accommodation_room_occupations"
+    ]
+    assert "room_id.apartments_blocks_id.floor_id.accommodation_id.type.name" in directus.requests[1][1]["fields"]
+    assert "<b>Общежитие:</b> Общежитие №4" in message
+    assert "<b>Тип:</b> Коридорный" in message
+    assert "Москва, ул. Студенческая, д. 12</a>" in message
+    assert "<b>Этаж:</b> 3" in message
+    assert "<b>Номер квартиры/блока:</b> 3А" in message
+    assert "<b>Номер комнаты:</b> 305" in message
+
+    for _ in range(3):
+        assert asyncio.run(webapp.check_checkin_status(2001)) == message
+    assert len(directus.requests) == 2
+
+    # Once the occupation changes, only the occupation is fetched again; the link stays cached
+    status_snapshots.invalidate("checkin", 2001)
+    assert asyncio.run(webapp.check_checkin_status(2001)) == message
+    assert len(directus.requests) == 3
@@ -0,0 +1,101 @@
+import os
+import json
+import asyncio
+
+from aiohttp import web
+
+from app.services import llm_rag
+
+
+async def collect_stream(body: bytes, content_type: str, question: str):
+    """Serve body from a local /ask endpoint and return the streamed pieces and the cached answer."""
+    async def ask(request):
+        return web.Response(body=body, headers={"Content-Type": content_type})
+
+    app = web.Application()
+    app.router.add_post("/ask", ask)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    os.environ["LLM_RAG_API_URL"] = f"http://127.0.0.1:{port}"
+    try:
+        pieces = [piece async for piece in llm_rag.stream_llm_rag(question)]
+        cached = llm_rag.answer_cache.get(llm_rag.LLM_RAG_DIRECTORY, question)
+    finally:
+        await llm_rag.close_llm_rag_session()
+        await runner.cleanup()
+    return pieces, cached
+
+
+def sse(*events: str) -> bytes:
+    return "".join(f"{event}\n\n" for event in events).encode("utf-8")
+
+
+def test_sse_keeps_leading_spaces_of_chunks():
+    body = sse("data: Привет", "data:  мир", "data: [DONE]")
+    pieces, cached = asyncio.run(collect_stream(body, "text/event-stream", "sse leading spaces"))
+    assert "".join(pieces) == "Привет мир"
+    assert cached == "Привет мир"
+
+
+def test_sse_json_tokens_are_joined_byte_for_byte():
+    tokens = ["Первая", " строка", "\n", "- пункт", " один\n", "2024"]
+    body = sse(*(f"data: {json.dumps({'token': token}, ensure_ascii=False)}" for token in tokens), "data: [DONE]")
+    pieces, cached = asyncio.run(collect_stream(body, "text/event-stream", "sse json tokens"))
+    assert "".join(pieces) == "".join(tokens)
+    assert cached == "".join(tokens)
+
+
+def test_sse_multiline_data_is_joined_with_newlines():
+    body = sse("data: Первая строка\ndata: Вторая строка\r\ndata:- пункт один", "data: [DONE]")
+    pieces, cached = asyncio.run(collect_stream(body, "text/event-stream", "sse multiline"))
+    assert pieces == ["Первая строка\nВторая строка\n- пункт один"]
+
+
+def test_ndjson_keeps_whitespace_inside_chunks():
+    lines = [{"token": "Ответ"}, {"token": " на"}, {"token": " вопрос\n"}]
+    body = "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines).encode("utf-8")
+    pieces, cached = asyncio.run(collect_stream(body, "application/x-ndjson", "ndjson whitespace"))
+    assert "".join(pieces) == "Ответ на вопрос\n"
+
+
+def test_plain_text_answer_is_returned_as_is():
+    answer = "Первая строка\nВторая строка\n- пункт один\n- пункт два"
+    pieces, cached = asyncio.run(collect_stream(answer.encode("utf-8"), "text/plain", "plain multiline"))
+    assert "".join(pieces) == answer
+    assert cached == answer
+
+
+def test_stream_cut_off_midway_raises_after_the_partial_chunks():
+    async def scenario():
+        async def ask(request):
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            await response.write(sse("data: Начало ответа"))
+            request.transport.close()
+            return response
+
+        app = web.Application()
+        app.router.add_post("/ask", ask)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        os.environ["LLM_RAG_API_URL"] = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+        pieces = []
+        try:
+            async for piece in llm_rag.stream_llm_rag("обрыв потока"):
+                pieces.append(piece)
+        except llm_rag.LLMStreamError as e:
+            return pieces, str(e)
+        finally:
+            await llm_rag.close_llm_rag_session()
+            await runner.cleanup()
+        return pieces, None
+
+    pieces, error = asyncio.run(scenario())
+    assert pieces == ["Начало ответа"]
+    assert error == llm_rag.LLM_UNAVAILABLE_MESSAGE
+    assert llm_rag.answer_cache.get(llm_rag.LLM_RAG_DIRECTORY, "обрыв потока") is None
@@ -0,0 +1,33 @@
+import asyncio
+
+from app.bot.executor import ChatExecutor
+from app.utils.metrics import registry
+
+
+def sample(name: str, labels: str) -> float:
+    prefix = f"{name}{{{labels}}} "
+    for line in registry.render().splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix):])
+    return 0.0
+
+
+def test_dropped_updates_are_counted_by_reason():
+    async def scenario():
+        executor = ChatExecutor(workers=1, max_pending=3, max_pending_per_chat=2)
+        before_chat = sample("bot_dropped_updates_total", 'reason="chat_full"')
+        before_full = sample("bot_dropped_updates_total", 'reason="executor_full"')
+        blocked = asyncio.Event()
+
+        async def job():
+            await blocked.wait()
+
+        results = [executor.submit(1, job) for _ in range(3)] + [executor.submit(2, job) for _ in range(2)]
+        blocked.set()
+        await executor.stop()
+        return results, before_chat, before_full
+
+    results, before_chat, before_full = asyncio.run(scenario())
+    assert results == [True, True, False, True, False]
+    assert sample("bot_dropped_updates_total", 'reason="chat_full"') == before_chat + 1
+    assert sample("bot_dropped_updates_total", 'reason="executor_full"') == before_full + 1
@@ -0,0 +1,48 @@
+import time
+
+from app.bot import outbox as outbox_module
+from app.bot.outbox import NotificationOutbox
+
+
+def test_claim_due_reclaims_stale_sending_rows_after_restart(tmp_path, monkeypatch):
+    path = str(tmp_path / "outbox.sqlite3")
+    outbox = NotificationOutbox(path)
+    notification_id = outbox.enqueue(42, "checkin", "Статус изменён")
+    assert [row["id"] for row in outbox.claim_due()] == [notification_id]
+    # The process dies before mark_sent, leaving the row in sending
+    outbox._conn.close()
+
+    restarted = NotificationOutbox(path)
+    # A fresh claim is not stale yet and is not handed out twice
+    assert restarted.claim_due() == []
+
+    real_time = time.time
+    monkeypatch.setattr(outbox_module.time, "time", lambda: real_time() + outbox_module.STALE_CLAIM_SECONDS + 1)
+    rows = restarted.claim_due()
+    assert [row["id"] for row in rows] == [notification_id]
+    assert restarted.get(notification_id)["state"] == "sending"
+    # Claimed again just now, so the next tick does not pick it up once more
+    assert restarted.claim_due() == []
+
+
+def test_purge_deletes_old_sent_rows_and_finished_jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbox_module, "PURGE_BATCH_SIZE", 2)
+    outbox = NotificationOutbox(str(tmp_path / "outbox.sqlite3"))
+    job_id = outbox.create_job("general")
+    sent = outbox.enqueue_many([1, 2, 3], "general", "Объявление", job_id=job_id)
+    outbox.update_job(job_id, "enqueued")
+    dead, pending = outbox.enqueue_many([4, 5], "general", "Объявление")
+    outbox.claim_due()
+    for notification_id in sent:
+        outbox.mark_sent(notification_id)
+    outbox.mark_dead(dead, 4, "bot was blocked by the user")
+    outbox.mark_retry(pending, "timeout", delay=60)
+
+    # Nothing is old enough yet
+    assert outbox.purge(time.time() - 3600) == 0
+
+    assert outbox.purge(time.time() + 1) == 3
+    assert all(outbox.get(notification_id) is None for notification_id in sent)
+    assert outbox.get_job(job_id) is None
+    assert outbox.get(dead)["state"] == "dead"
+    assert outbox.get(pending)["state"] == "pending"
@@ -0,0 +1,29 @@
+import asyncio
+import threading
+
+from app.bot.state import SQLiteStateStore
+
+
+def test_sqlite_state_store_queries_off_the_event_loop(tmp_path):
+    store = SQLiteStateStore(str(tmp_path / "state.sqlite3"), ttl=60)
+    query_threads = []
+    for name in ("_get", "_set", "_delete"):
+        method = getattr(store, name)
+
+        def recorded(*args, method=method):
+            query_threads.append(threading.get_ident())
+            return method(*args)
+
+        setattr(store, name, recorded)
+
+    async def scenario():
+        await store.set(7, {"step": "ask_question"})
+        state = await store.get(7)
+        await store.delete(7)
+        return threading.get_ident(), state, await store.get(7)
+
+    loop_thread, state, deleted = asyncio.run(scenario())
+    assert state == {"step": "ask_question"}
+    assert deleted is None
+    assert len(query_threads) == 4
+    assert loop_thread not in query_threads
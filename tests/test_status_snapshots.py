@@ -0,0 +1,82 @@
+import asyncio
+
+from app.services import webapp
+from app.services.status_snapshots import status_snapshots, StatusSnapshotStore
+from app.utils.cache import MISSING
+
+
+class FakeDirectus:
+    """Answers the two lookups of a check-in status; link is the system user of the Telegram account."""
+
+    def __init__(self, link=None, room=True):
+        self.link = link
+        self.room = room
+
+    async def __call__(self, endpoint, params=None, **kwargs):
+        if endpoint == "/items/telegram_user_links":
+            return {"data": [{"user_id": self.link}] if self.link else []}
+        room = {"room_number": "101", "max_capacity": 2} if self.room else None
+        return {"data": [{"id": 7, "room_id": room}]}
+
+
+def test_unlinked_status_is_not_snapshotted(monkeypatch):
+    directus = FakeDirectus()
+    monkeypatch.setattr(webapp, "make_directus_request", directus)
+
+    message = asyncio.run(webapp.check_checkin_status(1001))
+    assert "не привязан" in message
+    assert status_snapshots.get("checkin", 1001) is MISSING
+    assert status_snapshots.get_stale("checkin", 1001)[0] is MISSING
+
+    # Once the link cache is invalidated, the account is linked straight away
+    directus.link = "user-1"
+    webapp.invalidate_user_link(1001)
+    assert "Вы заселены" in asyncio.run(webapp.check_checkin_status(1001))
+    assert "Вы заселены" in status_snapshots.get("checkin", 1001)
+
+
+def test_error_render_is_not_snapshotted(monkeypatch):
+    monkeypatch.setattr(webapp, "make_directus_request", FakeDirectus(link="user-2", room=False))
+
+    message = asyncio.run(webapp.check_checkin_status(1002))
+    assert message.startswith("⚠️")
+    assert status_snapshots.get("checkin", 1002) is MISSING
+
+
+def test_user_link_invalidation_drops_snapshots(monkeypatch):
+    monkeypatch.setattr(webapp, "make_directus_request", FakeDirectus(link="user-3"))
+    asyncio.run(webapp.check_checkin_status(1003))
+    assert status_snapshots.users_of("directus_users", ["user-3"]) == {("checkin", 1003)}
+
+    webapp.invalidate_user_link(1003)
+    assert status_snapshots.get("checkin", 1003) is MISSING
+    assert status_snapshots.get_stale("checkin", 1003)[0] is MISSING
+    assert status_snapshots.users_of("directus_users", ["user-3"]) == set()
+
+
+def test_index_and_versions_stay_bounded_by_the_cache():
+    store = StatusSnapshotStore(maxsize=3, ttl=60, stale_ttl=60)
+    for telegram_id in range(10):
+        store.put("checkin", telegram_id, "✅", [("directus_users", f"user-{telegram_id}")],
+                  version=store.version("checkin", telegram_id))
+        store.invalidate("checkin", telegram_id)
+        store.discard("relocation", telegram_id)
+
+    # Evicted snapshots leave the index along with the cache
+    assert store.users_of("directus_users", ["user-0"]) == set()
+    assert store.stats()["size"] == 3
+    assert len(store._invalidated) == 3
+    assert store.stats()["versions"] <= 3
+
+
+def test_render_started_before_versions_were_collected_is_not_stored():
+    store = StatusSnapshotStore(maxsize=2, ttl=60, stale_ttl=60)
+    version = store.version("checkin", 1)
+    store.invalidate("checkin", 1)
+    # Enough invalidations of other users to start the counters over
+    for telegram_id in range(2, 6):
+        store.discard("checkin", telegram_id)
+
+    assert not store.put("checkin", 1, "outdated", [("directus_users", "user-1")], version=version)
+    assert store.put("checkin", 1, "fresh", [("directus_users", "user-1")], version=store.version("checkin", 1))
+    assert store.get("checkin", 1) == "fresh"
@@ -0,0 +1,34 @@
+import asyncio
+
+from app.services import directus
+
+
+def test_warm_up_fills_what_relocation_statuses_read(monkeypatch):
+    requests = []
+
+    async def stub(endpoint, method="GET", params=None):
+        requests.append((endpoint, params))
+        if endpoint == "/items/bus_schedule":
+            return {"data": []}
+        if endpoint == "/items/student_accommodation":
+            return {"data": [{"id": 901, "name": "Общежитие №1"}, {"id": 902, "name": "Общежитие №2"}]}
+        raise AssertionError(f"Unexpected Directus request to {endpoint}")
+
+    monkeypatch.setattr(directus, "make_directus_request", stub)
+
+    async def scenario():
+        await directus.warm_up_caches()
+        warmed = len(requests)
+        # The lookup render_relocation_status makes for the two dormitories of a finished relocation
+        accommodations = await directus.get_items_by_ids("student_accommodation", [901, 902], ["name"])
+        return warmed, accommodations
+
+    warmed, accommodations = asyncio.run(scenario())
+    params = dict(requests)
+    assert sorted(params) == ["/items/bus_schedule", "/items/student_accommodation"]
+    # Leaves room for entries requests cache on their own
+    assert params["/items/student_accommodation"]["limit"] <= directus.reference_cache.maxsize // 2
+    # Served from the warmed cache
+    assert len(requests) == warmed
+    assert accommodations["901"]["name"] == "Общежитие №1"
+    assert accommodations["902"]["name"] == "Общежитие №2"
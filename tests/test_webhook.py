@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from telebot.async_telebot import AsyncTeleBot
+
+from app.api import routes
+from app.bot import bot as bot_module
+from app.bot.bot import setup_webhook
+
+
+def webhook_paths(monkeypatch, mode):
+    monkeypatch.setenv("TELEGRAM_UPDATE_MODE", mode)
+    app = FastAPI()
+    routes.setup_routes(app, AsyncTeleBot("1:x"))
+    return [route.path for route in app.routes if route.path.startswith("/telegram")]
+
+
+def test_webhook_route_exists_only_in_webhook_mode(monkeypatch):
+    bot = routes.bot
+    try:
+        assert webhook_paths(monkeypatch, "polling") == []
+        assert webhook_paths(monkeypatch, "webhook") == ["/telegram/webhook"]
+    finally:
+        routes.bot = bot
+
+
+@pytest.mark.parametrize("secret, header", [(None, None), (None, ""), ("s3cret", None), ("s3cret", "guess")])
+def test_webhook_rejects_requests_without_the_secret(monkeypatch, secret, header):
+    if secret is None:
+        monkeypatch.delenv("TELEGRAM_WEBHOOK_SECRET", raising=False)
+    else:
+        monkeypatch.setenv("TELEGRAM_WEBHOOK_SECRET", secret)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(routes.telegram_webhook(request=None, x_telegram_bot_api_secret_token=header))
+    assert error.value.status_code == 403
+
+
+def test_setup_webhook_requires_a_secret(monkeypatch):
+    monkeypatch.setenv("TELEGRAM_WEBHOOK_URL", "https://example.com/telegram/webhook")
+    monkeypatch.delenv("TELEGRAM_WEBHOOK_SECRET", raising=False)
+    with pytest.raises(ValueError):
+        asyncio.run(setup_webhook(AsyncTeleBot("1:x")))
+
+
+def test_polling_starts_after_remove_webhook_failures(monkeypatch):
+    calls = []
+
+    class FlakyBot:
+        async def remove_webhook(self):
+            calls.append("remove_webhook")
+            if len(calls) < 3:
+                raise ConnectionError("api.telegram.org unreachable")
+
+        async def infinity_polling(self):
+            calls.append("polling")
+
+    monkeypatch.setattr(bot_module, "REMOVE_WEBHOOK_RETRY_DELAYS", (0,))
+    asyncio.run(bot_module.run_polling(FlakyBot()))
+    assert calls == ["remove_webhook", "remove_webhook", "remove_webhook", "polling"]